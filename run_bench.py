@@ -0,0 +1,327 @@
+"""
+benchmarks for the xvenv sub-cmds
+
+runs in a sandbox folder with a synthetic project,
+and installs only from a local wheel folder without index access.
+
+create the wheel folder beforehand e.g. with
+
+    python3 xvenv/xvenv.py wheelhouse -dir ~/wheels -tool setuptools wheel black flake8
+
+then
+
+    python3 run_bench.py -wheels ~/wheels -n 5 -o bench.json
+    python3 run_bench.py -wheels ~/wheels -baseline bench.json
+
+the startup benchmarks measure the import time with -X importtime,
+and fail if one of LAZY_MODULES is imported on startup.
+
+"""
+
+import sys
+import os
+import argparse
+import subprocess
+import tempfile
+import shutil
+import json
+import time
+import platform
+
+XVENV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xvenv", "xvenv.py")
+
+BENCHMARKS = [
+    # name, cmd-line, prepare
+    ("setup", ["setup", "--clear"], None),
+    ("setup_copy", ["setup", "--clear", "--copy"], None),
+    ("pip", ["pip", "--wheelhouse", "{wheels}"], ["setup", "--clear"]),
+    (
+        "make_quick",
+        ["make", "--quick", "--force", "--wheelhouse", "{wheels}", "-tool", "{tools}"],
+        None,
+    ),
+    (
+        "make_quick_noop",
+        ["make", "--quick", "--wheelhouse", "{wheels}", "-tool", "{tools}"],
+        None,
+    ),
+    ("run_true", ["run", "true"], None),
+    ("qtest", ["qtest", "--lint", "--unit-test"], None),
+    ("qtest_recheck", ["qtest", "--lint", "--unit-test", "--recheck"], None),
+]
+
+SAMPLE_MODULE = """
+def add(a, b):
+    return a + b
+
+
+def mul(a, b):
+    return a * b
+"""
+
+SAMPLE_TEST = """
+import unittest
+
+from {name}.mod{i} import add, mul
+
+
+class TestMod{i}(unittest.TestCase):
+    def test_add(self):
+        self.assertEqual(add(1, 2), 3)
+
+    def test_mul(self):
+        self.assertEqual(mul(2, 3), 6)
+"""
+
+
+def create_project(folder, name="benchproj", modules=20):
+    pkg = os.path.join(folder, name)
+    tests = os.path.join(folder, "tests")
+    os.makedirs(pkg)
+    os.makedirs(tests)
+    for fnam in [os.path.join(pkg, "__init__.py"), os.path.join(tests, "__init__.py")]:
+        open(fnam, "w").close()
+    for i in range(modules):
+        with open(os.path.join(pkg, f"mod{i}.py"), "w") as f:
+            f.write(SAMPLE_MODULE)
+        with open(os.path.join(tests, f"test_mod{i}.py"), "w") as f:
+            f.write(SAMPLE_TEST.format(name=name, i=i))
+    with open(os.path.join(folder, "requirements.txt"), "w") as f:
+        f.write("")
+
+
+def benchmark(name):
+    for bench in BENCHMARKS:
+        if bench[0] == name:
+            return bench
+    raise KeyError(name)
+
+
+def xvenv(args_, folder, env):
+    rc = subprocess.run(
+        [sys.executable, XVENV, *args_],
+        cwd=folder,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if rc.returncode:
+        raise Exception(f"failed {args_}: {rc.stderr.decode()}")
+
+
+def expand(args_, wheels, tools):
+    rc = []
+    for a in args_:
+        if a == "{tools}":
+            rc.extend(tools)
+        else:
+            rc.append(a.replace("{wheels}", wheels))
+    return rc
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    idx = max(0, min(len(samples) - 1, int(round(p / 100 * len(samples) + 0.5)) - 1))
+    return samples[idx]
+
+
+def stats(samples):
+    return {
+        "n": len(samples),
+        "median": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "min": min(samples),
+        "samples": samples,
+    }
+
+
+# modules imported lazily, not on startup
+LAZY_MODULES = ["subprocess", "tempfile", "glob", "json", "hashlib", "asyncio"]
+
+STARTUP = [
+    # name, cmd-line
+    ("startup_version", ["--version"]),
+    ("startup_run_help", ["run", "--help"]),
+]
+
+
+def import_time(args_):
+    """returns the total import time in seconds, and the imported modules,
+    from the -X importtime output of the interpreter"""
+    rc = subprocess.run(
+        [sys.executable, "-X", "importtime", XVENV, *args_],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    total = 0
+    modules = []
+    for line in rc.stderr.decode().splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        modules.append(name.strip())
+        # top level imports hold the cumulated time
+        if not name.startswith("  "):
+            total += int(parts[1])
+    return total / 1000000, modules
+
+
+def run_startup(iterations, only=None):
+    """startup time of the cmd-line parsing, and modules imported on startup"""
+    results = {}
+    errors = []
+    for name, args_ in STARTUP:
+        if only and name not in only:
+            continue
+        samples = []
+        for i in range(iterations):
+            total, modules = import_time(args_)
+            samples.append(total)
+        results[name] = stats(samples)
+        eager = sorted(set(LAZY_MODULES) & set(modules))
+        if len(eager) > 0:
+            errors.append(name)
+        print(
+            f"{name:20}",
+            f"median {results[name]['median']:8.3f}s",
+            f"p95 {results[name]['p95']:8.3f}s",
+            "imports" if len(eager) > 0 else "",
+            *eager,
+        )
+    return results, errors
+
+
+def run_benchmarks(wheels, tools, iterations, only=None):
+    sandbox = tempfile.mkdtemp(prefix="xvenv-bench-")
+    results = {}
+    try:
+        folder = os.path.join(sandbox, "benchproj")
+        create_project(folder)
+
+        env = dict(os.environ)
+        env.pop("VIRTUAL_ENV", None)
+        env.update(
+            {
+                "XVENV_CACHE": os.path.join(sandbox, "cache"),
+                "PIP_NO_INDEX": "1",
+                "PIP_FIND_LINKS": wheels,
+                "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+            }
+        )
+
+        # full venv required for run and qtest
+        make = expand(benchmark("make_quick")[1], wheels, tools)
+        xvenv(make, folder, env)
+
+        for name, args_, prepare in BENCHMARKS:
+            if only and name not in only:
+                continue
+            args_ = expand(args_, wheels, tools)
+            samples = []
+            for i in range(iterations):
+                if prepare:
+                    xvenv(prepare, folder, env)
+                start = time.perf_counter()
+                xvenv(args_, folder, env)
+                samples.append(time.perf_counter() - start)
+            results[name] = stats(samples)
+            print(
+                f"{name:20}",
+                f"median {results[name]['median']:8.3f}s",
+                f"p95 {results[name]['p95']:8.3f}s",
+            )
+            # restore the full venv after setup benchmarks
+            if name.startswith("setup"):
+                xvenv(make, folder, env)
+    finally:
+        shutil.rmtree(sandbox, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """returns the names of benchmarks slower than baseline median by threshold"""
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = res["median"] / base["median"]
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:20}", f"{ratio:6.2f}x", "baseline", f"{base['median']:.3f}s", mark
+        )
+    return regressions
+
+
+def main_func():
+    parser = argparse.ArgumentParser(
+        description="benchmarks for the xvenv sub-cmds, runs without index access"
+    )
+    parser.add_argument("-wheels", required=True, help="local wheel folder")
+    parser.add_argument(
+        "-tool",
+        nargs="*",
+        default=["setuptools", "wheel", "black", "flake8"],
+        help="tools to install from the wheel folder (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-n", type=int, default=5, help="iterations (default: %(default)s)"
+    )
+    parser.add_argument(
+        "-bench", nargs="*", default=None, help="benchmarks to run (default: all)"
+    )
+    parser.add_argument("-o", dest="output", help="write results to json file")
+    parser.add_argument("-baseline", help="compare with results from json file")
+    parser.add_argument(
+        "-threshold",
+        type=float,
+        default=0.2,
+        help="allowed slow down of the median against baseline (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    results, errors = run_startup(args.n, args.bench)
+    results.update(
+        run_benchmarks(
+            os.path.abspath(os.path.expanduser(args.wheels)),
+            args.tool,
+            args.n,
+            args.bench,
+        )
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "meta": {
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "time": time.time(),
+                        "iterations": args.n,
+                    },
+                    "results": results,
+                },
+                f,
+                indent=4,
+            )
+
+    regressions = errors
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions.extend(compare(results, baseline, args.threshold))
+    if len(regressions) > 0:
+        print("regressions", *regressions, file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    rc = main_func()
+    sys.exit(rc)
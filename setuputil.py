@@ -9,8 +9,12 @@ import platform
 import sys
 import os
 import importlib
+import importlib.metadata
 import re
 import json
+import glob
+import hashlib
+import sysconfig
 import subprocess
 
 import setuptools
@@ -345,16 +349,105 @@ packages.
 """
 
 
+_regex_spec = re.compile(
+    r"^\s*(?P<name>[A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[(?P<extras>[^\]]*)\])?"
+    r"\s*(?P<spec>[^;@]*?)\s*(@\s*(?P<url>[^;]*?))?\s*(;\s*(?P<marker>.*))?$"
+)
+
+
+_regex_version = re.compile(r"^(===|==|>=|<=|~=|!=|>|<)\s*(.*)$")
+
+# replaced when bumping, upper bounds and exclusions are kept
+_lower_ops = ["===", "==", ">=", ">", "~="]
+
+
+def normalize_name(name):
+    """PEP 503 normalized package name"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
 class Package(object):
     def __init__(self, spec):
+        self.extras = []
+        self.marker = None
+        self.url = None
+        self.op = None
+        self.specs = []
+
         if spec.startswith("-e"):
             self.editable = True
             self.package = spec[spec.find("#egg=") + 5 :]
             self.version = None
-        else:
-            self.editable = False
-            self.package = spec[: spec.find("==")]
-            self.version = spec[spec.find("==") + 2 :]
+            return
+
+        self.editable = False
+        m = _regex_spec.match(spec)
+        if m is None:
+            raise Exception(f"invalid requirement {spec}")
+
+        self.package = m.group("name")
+        if m.group("extras"):
+            self.extras = [x.strip() for x in m.group("extras").split(",")]
+        self.marker = m.group("marker")
+        self.url = m.group("url")
+
+        # all version specs, e.g. ">=1.0,<2"
+        for vspec in m.group("spec").split(","):
+            mv = _regex_version.match(vspec.strip())
+            if mv is None:
+                if len(vspec.strip()) > 0:
+                    raise Exception(f"invalid version spec {vspec} in {spec}")
+                continue
+            self.specs.append((mv.group(1), mv.group(2).strip()))
+
+        self.version = None
+        if len(self.specs) > 0:
+            self.op, self.version = self.specs[0]
+
+    @classmethod
+    def from_installed(cls, name, version, direct_url=None):
+        """from installed metadata, and contents of direct_url.json"""
+        pack = cls.__new__(cls)
+        pack.package = name
+        pack.version = version
+        pack.op = "=="
+        pack.extras = []
+        pack.marker = None
+        pack.url = None
+        pack.specs = [("==", version)]
+        pack.editable = False
+        if direct_url is not None:
+            pack.url = direct_url.get("url")
+            if direct_url.get("dir_info", {}).get("editable"):
+                pack.editable = True
+                pack.version = None
+        return pack
+
+    @property
+    def key(self):
+        return normalize_name(self.package)
+
+    def requirement(self, cmp=None, version=None, clear=False):
+        """requirement spec with extras, version specs, url, and marker.
+        with clear, or a new version, the pins and lower bounds are removed"""
+        spec = self.package
+        if len(self.extras) > 0:
+            spec += "[" + ",".join(self.extras) + "]"
+        if self.url:
+            # a direct reference has no version specs
+            spec += f" @ {self.url}"
+            if self.marker:
+                spec += f" ; {self.marker}"
+            return spec
+        specs = self.specs
+        if clear or version is not None:
+            specs = [(op, v) for op, v in specs if op not in _lower_ops]
+        if version is not None:
+            specs = [(cmp, version), *specs]
+        spec += ",".join(op + v for op, v in specs)
+        if self.marker:
+            spec += f"; {self.marker}"
+        return spec
 
     def __repr__(self):
         return (
@@ -363,29 +456,77 @@ class Package(object):
         )
 
 
-def load_installed_versions():
-    packs = {}
+def find_site_packages(venv=None):
+    """site-packages of a venv folder, or of the running interpreter"""
+    if venv is not None:
+        pattern = os.path.join(venv, "lib", "python*", "site-packages")
+        return sorted(glob.glob(pattern))
+    paths = sysconfig.get_paths()
+    return sorted(set([paths["purelib"], paths["platlib"]]))
 
-    proc = subprocess.Popen(
-        [
-            "pip",
-            "freeze",
-        ],
-        stdout=subprocess.PIPE,
+
+def _index_cache_fnam(paths):
+    cache = os.environ.get(
+        "XVENV_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "xvenv")
     )
+    key = hashlib.sha256("\0".join(paths).encode()).hexdigest()[:16]
+    return os.path.join(cache, "pkgindex", f"{key}.json")
 
-    if proc is None:
-        raise Exception("could not start pip")
 
-    while True:
-        line = proc.stdout.readline()
-        if len(line) == 0:
-            break
-        line = line.decode().strip()
-        print(line)
-        p = Package(line)
-        packs[p.package] = p
+_index_cache = {}
+
+
+def load_installed_index(paths):
+    """index of installed distributions read from *.dist-info metadata.
+    the index is cached, and keyed by the mtimes of the site-packages folders"""
+    stamp = [[p, os.stat(p).st_mtime_ns] for p in paths if os.path.isdir(p)]
+    key = json.dumps(stamp)
 
+    if key in _index_cache:
+        return _index_cache[key]
+
+    fnam = _index_cache_fnam(paths)
+    try:
+        with open(fnam) as f:
+            cached = json.load(f)
+        if cached["stamp"] == stamp:
+            _index_cache[key] = cached["index"]
+            return cached["index"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = {}
+    for dist in importlib.metadata.distributions(path=paths):
+        name = dist.metadata["Name"]
+        if name is None:
+            continue
+        direct_url = dist.read_text("direct_url.json")
+        index[normalize_name(name)] = {
+            "name": name,
+            "version": dist.version,
+            "direct_url": json.loads(direct_url) if direct_url else None,
+        }
+
+    try:
+        os.makedirs(os.path.dirname(fnam), exist_ok=True)
+        with open(fnam, "w") as f:
+            json.dump({"stamp": stamp, "index": index}, f)
+    except OSError:
+        pass
+
+    _index_cache[key] = index
+    return index
+
+
+def load_installed_versions(venv=None):
+    """installed packages of a venv folder, or of the running interpreter.
+    keyed by the normalized package name"""
+    packs = {}
+    index = load_installed_index(find_site_packages(venv))
+    for key, entry in sorted(index.items()):
+        p = Package.from_installed(entry["name"], entry["version"], entry["direct_url"])
+        print(p.package, p.version if p.version else "(editable)")
+        packs[key] = p
     return packs
 
 
@@ -394,17 +535,12 @@ def load_requirements_versions_cleared():
     requirements = load_requirements()
     print("loaded", requirements)
 
-    def clr(x):
-        p1 = x.find("==")
-        p2 = x.find(">=")
-        p3 = x.find(">")
-        p = max(p1, p2)
-        p = max(p, p3)
-        if p < 0:
-            return x
-        return x[:p]
-
-    req_cleared = list(map(lambda x: clr(x), requirements))
+    req_cleared = []
+    for x in requirements:
+        if x.startswith("-"):
+            req_cleared.append(x)
+            continue
+        req_cleared.append(Package(x).requirement(clear=True))
 
     print("cleared", req_cleared)
 
@@ -420,12 +556,22 @@ def bump_versions(req_cleared, packs, strong=False):
 
     new_req = []
     for p in req_cleared:
-        pack = packs[p]
-        if pack.version is None:
-            new_req.append(f"{pack.package}")
+        if p.startswith("-"):
+            new_req.append(p)
+            continue
+        req = Package(p)
+        pack = packs.get(req.key)
+        if pack is None:
+            new_req.append(p)
+            print(new_req[-1:], "not installed", file=sys.stderr)
+        elif pack.version is None:
+            new_req.append(req.requirement())
             print(new_req[-1:], "from editable", file=sys.stderr)
+        elif req.url:
+            new_req.append(req.requirement())
+            print(new_req[-1:], "from url", file=sys.stderr)
         else:
-            new_req.append(f"{pack.package}{cmp}{pack.version}")
+            new_req.append(req.requirement(cmp, pack.version))
 
     print("bumbed", new_req)
 
@@ -439,8 +585,8 @@ def save_requirements(new_requirements):
         f.write(new_requirements)
 
 
-def bump_requirements(strong=False):
-    packs = load_installed_versions()
+def bump_requirements(strong=False, venv=None):
+    packs = load_installed_versions(venv)
     req_cleared = load_requirements_versions_cleared()
     req_vers = bump_versions(req_cleared, packs, strong=strong)
     save_requirements(req_vers)
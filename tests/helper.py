@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def touch(fnam, size=0):
+    os.makedirs(os.path.dirname(fnam), exist_ok=True)
+    with open(fnam, "wb") as f:
+        f.write(b"x" * size)
+
+
+class TempDirTestCase(unittest.TestCase):
+    """a new temp folder for each test, and with chdir the working folder"""
+
+    chdir = False
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="xvenv-test-")
+        if self.chdir:
+            self.cwd = os.getcwd()
+            os.chdir(self.root)
+
+    def tearDown(self):
+        if self.chdir:
+            os.chdir(self.cwd)
+        shutil.rmtree(self.root)
+
+    def path(self, *names):
+        return os.path.join(self.root, *names)
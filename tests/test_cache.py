@@ -0,0 +1,53 @@
+import argparse
+import sys
+import unittest
+
+from tests.helper import TempDirTestCase
+from xvenv.xvenv import cache_key
+
+
+def write(fnam, text):
+    with open(fnam, "w") as f:
+        f.write(text)
+
+
+class CacheKeyTestCase(TempDirTestCase):
+    chdir = True
+
+    def key(self, **kwargs):
+        opts = {"python": sys.executable, "tool": ["pip", "wheel"], "copy": False}
+        opts.update(kwargs)
+        return cache_key(argparse.Namespace(**opts))
+
+    def test_same_inputs(self):
+        write("requirements.txt", "six\n")
+        self.assertEqual(self.key(), self.key())
+        self.assertEqual(self.key(), self.key(tool=["wheel", "pip"]))
+
+    def test_tools(self):
+        self.assertNotEqual(self.key(), self.key(tool=["pip"]))
+
+    def test_requirements(self):
+        key = self.key()
+        write("requirements.txt", "six\n")
+        self.assertNotEqual(self.key(), key)
+        key = self.key()
+        write("requirements.txt", "six==1.0\n")
+        self.assertNotEqual(self.key(), key)
+
+    def test_constraints(self):
+        key = self.key()
+        write("constraints.txt", "six<2\n")
+        self.assertNotEqual(self.key(), key)
+        write("other.txt", "six<3\n")
+        self.assertNotEqual(self.key(constraint="other.txt"), self.key())
+
+    def test_copy(self):
+        self.assertNotEqual(self.key(copy=True), self.key())
+
+    def test_interpreter(self):
+        self.assertIsNone(self.key(python="xvenv-no-such-python"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from tests.helper import TempDirTestCase, touch
+from xvenv.xvenv import clean_matches
+
+
+class CleanMatchesTestCase(TempDirTestCase):
+    def test_patterns(self):
+        touch(self.path("build", "lib", "a.py"))
+        touch(self.path("pkg", "build", "b.py"))
+        touch(self.path("pkg", "__pycache__", "a.pyc"))
+        touch(self.path("pkg", "c.pyc"))
+        touch(self.path("pkg", "c.py"))
+
+        dirs, files = clean_matches(self.root, ["/build", "__pycache__", "*.pyc"])
+        self.assertEqual(
+            sorted(dirs), [self.path("build"), self.path("pkg", "__pycache__")]
+        )
+        self.assertEqual(files, [self.path("pkg", "c.pyc")])
+
+    def test_skip(self):
+        touch(self.path(".venv", "lib", "a.pyc"))
+        touch(self.path("other", "pyvenv.cfg"))
+        touch(self.path("other", "b.pyc"))
+        touch(self.path(".git", "c.pyc"))
+
+        self.assertEqual(clean_matches(self.root, ["*.pyc"]), ([], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
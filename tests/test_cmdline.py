@@ -0,0 +1,55 @@
+import unittest
+
+from xvenv.xvenv import (
+    add_run_parser,
+    add_workspace_parser,
+    main_parser,
+    split_passthru,
+    subcmd_name,
+)
+
+
+class SubCmdNameTestCase(unittest.TestCase):
+    def setUp(self):
+        self.parser = main_parser()
+
+    def test_name(self):
+        self.assertEqual(subcmd_name(self.parser, ["make"]), "make")
+        self.assertEqual(subcmd_name(self.parser, ["-V", "make", "-q"]), "make")
+
+    def test_opt_values(self):
+        argv = ["-python", "python3.11", "-cwd", "make", "qtest"]
+        self.assertEqual(subcmd_name(self.parser, argv), "qtest")
+        self.assertEqual(subcmd_name(self.parser, ["-cwd=make", "run"]), "run")
+
+    def test_none(self):
+        self.assertIsNone(subcmd_name(self.parser, []))
+        self.assertIsNone(subcmd_name(self.parser, ["-V", "-h"]))
+
+
+class SplitPassthruTestCase(unittest.TestCase):
+    def setUp(self):
+        self.subparsers = main_parser().add_subparsers()
+
+    def test_run(self):
+        add_run_parser(self.subparsers)
+        run = self.subparsers.choices["run"]
+        self.assertEqual(
+            split_passthru(run, ["--jobs", "2", "make", "-j", "4"]),
+            (["--jobs", "2"], ["make", "-j", "4"]),
+        )
+        self.assertEqual(
+            split_passthru(run, ["--", "-x", "--jobs"]), ([], ["-x", "--jobs"])
+        )
+
+    def test_workspace(self):
+        add_workspace_parser(self.subparsers)
+        workspace = self.subparsers.choices["workspace"]
+        self.assertEqual(
+            split_passthru(workspace, ["-j", "2", "run", "echo", "-j", "4"], 1),
+            (["-j", "2", "run"], ["echo", "-j", "4"]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
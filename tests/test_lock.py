@@ -0,0 +1,38 @@
+import unittest
+
+from xvenv.xvenv import lock_lines
+
+
+def item(name, version, sha256=None, url=None):
+    info = {"url": url or f"https://files/{name}-{version}.whl"}
+    if sha256 is not None:
+        info["archive_info"] = {"hashes": {"sha256": sha256}}
+    rc = {"metadata": {"name": name, "version": version}, "download_info": info}
+    if url is not None:
+        rc["is_direct"] = True
+    return rc
+
+
+class LockLinesTestCase(unittest.TestCase):
+    def test_hashes(self):
+        report = {"install": [item("zlib", "1.0", "bb"), item("Attrs", "2.1", "aa")]}
+        self.assertEqual(
+            lock_lines(report),
+            ["Attrs==2.1 --hash=sha256:aa", "zlib==1.0 --hash=sha256:bb"],
+        )
+
+    def test_missing_hash(self):
+        # pip requires hashes for all packages, or none
+        report = {"install": [item("a", "1", "aa"), item("b", "2")]}
+        self.assertEqual(lock_lines(report), ["a==1", "b==2"])
+
+    def test_direct_url(self):
+        report = {"install": [item("a", "1", url="git+https://x.org/a.git")]}
+        self.assertEqual(lock_lines(report), ["a @ git+https://x.org/a.git"])
+
+    def test_empty(self):
+        self.assertEqual(lock_lines({}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
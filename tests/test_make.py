@@ -0,0 +1,84 @@
+import os
+import unittest
+
+from tests.helper import TempDirTestCase, touch
+from xvenv.xvenv import StepManifest, make_step, tree_fingerprint
+
+
+class StepManifestTestCase(TempDirTestCase):
+    chdir = True
+
+    def manifest(self, force=False):
+        return StepManifest(self.path(".venv", ".xvenv", "manifest.json"), force)
+
+    def step(self, manifest, name, fp, **kwargs):
+        calls = []
+        make_step(manifest, name, lambda args_: calls.append(name), None, fp, **kwargs)
+        return len(calls) > 0
+
+    def test_fingerprint(self):
+        fp = StepManifest.fingerprint("setup", "python3", None, False)
+        self.assertEqual(fp, StepManifest.fingerprint("setup", "python3", None, False))
+        self.assertNotEqual(
+            fp, StepManifest.fingerprint("setup", "python3", None, True)
+        )
+        # chained, a changed step changes all following
+        self.assertNotEqual(
+            StepManifest.fingerprint("pip", fp),
+            StepManifest.fingerprint("pip", StepManifest.fingerprint("setup")),
+        )
+
+    def test_reuse(self):
+        manifest = self.manifest()
+        self.assertTrue(self.step(manifest, "pip", "a"))
+        self.assertFalse(self.step(manifest, "pip", "a"))
+        self.assertEqual(manifest.reused, ["pip"])
+        self.assertTrue(self.step(manifest, "pip", "b"))
+        self.assertTrue(self.step(manifest, "pip", "b", volatile=True))
+
+    def test_stored(self):
+        self.step(self.manifest(), "pip", "a")
+        self.assertFalse(self.step(self.manifest(), "pip", "a"))
+        self.assertTrue(self.step(self.manifest(force=True), "pip", "a"))
+
+    def test_clear(self):
+        manifest = self.manifest()
+        self.step(manifest, "req", "a")
+        manifest.clear()
+        self.assertTrue(self.step(manifest, "req", "a"))
+        # the durations are kept for the deps report
+        manifest.clear()
+        self.assertIsNotNone(manifest.duration("req"))
+
+    def test_restored(self):
+        manifest = self.manifest()
+        self.assertFalse(self.step(manifest, "deps", "a", restored=True))
+        self.assertEqual(manifest.reused, ["deps"])
+        # the chain continues from the restored steps
+        self.assertFalse(self.step(self.manifest(), "deps", "a"))
+
+
+class TreeFingerprintTestCase(TempDirTestCase):
+    def test_content(self):
+        fnam = self.path("pkg", "a.py")
+        touch(fnam, 10)
+        fp = tree_fingerprint(self.root)
+
+        # mtime only
+        os.utime(fnam, (0, 0))
+        self.assertEqual(tree_fingerprint(self.root), fp)
+
+        touch(fnam, 11)
+        self.assertNotEqual(tree_fingerprint(self.root), fp)
+
+    def test_skip(self):
+        touch(self.path("a.py"))
+        fp = tree_fingerprint(self.root)
+        touch(self.path("build", "lib", "a.py"))
+        touch(self.path(".venv", "bin", "python"))
+        touch(self.path("x.egg-info", "PKG-INFO"))
+        self.assertEqual(tree_fingerprint(self.root), fp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from tests.helper import TempDirTestCase, touch
+from xvenv.xvenv import shards, shards_by_count
+
+
+class ShardsTestCase(TempDirTestCase):
+    def test_shards(self):
+        files = []
+        for name, size in [("a", 100), ("b", 60), ("c", 50), ("d", 10)]:
+            files.append(self.path(name))
+            touch(files[-1], size)
+        a, b, c, d = files
+
+        self.assertEqual(shards(files, 2), [[a, d], [b, c]])
+        self.assertEqual(shards(files, 1), [files])
+        # no empty shards
+        self.assertEqual(len(shards(files[:2], 4)), 2)
+        # missing files are left out
+        self.assertEqual(shards([a, self.path("x")], 2), [[a]])
+
+    def test_shards_by_count(self):
+        self.assertEqual(shards_by_count(list("abcde"), 2), [list("ace"), list("bd")])
+        self.assertEqual(shards_by_count(list("ab"), 4), [["a"], ["b"]])
+        self.assertEqual(shards_by_count([], 4), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
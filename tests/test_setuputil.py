@@ -0,0 +1,75 @@
+import unittest
+
+from setuputil import Package, bump_versions
+
+
+class PackageTestCase(unittest.TestCase):
+    def test_plain(self):
+        p = Package("foo")
+        self.assertEqual(p.package, "foo")
+        self.assertEqual(p.specs, [])
+        self.assertIsNone(p.version)
+        self.assertEqual(p.requirement(), "foo")
+
+    def test_pinned(self):
+        p = Package("foo==1.0")
+        self.assertEqual((p.op, p.version), ("==", "1.0"))
+        self.assertEqual(p.requirement(), "foo==1.0")
+        self.assertEqual(p.requirement(clear=True), "foo")
+        self.assertEqual(p.requirement(">=", "1.2"), "foo>=1.2")
+
+    def test_extras(self):
+        p = Package("Foo_Bar[a, b]>=1")
+        self.assertEqual(p.extras, ["a", "b"])
+        self.assertEqual(p.key, "foo-bar")
+        self.assertEqual(p.requirement(), "Foo_Bar[a,b]>=1")
+
+    def test_marker(self):
+        p = Package('foo>=1 ; python_version < "3.12"')
+        self.assertEqual(p.marker, 'python_version < "3.12"')
+        self.assertEqual(p.requirement(), 'foo>=1; python_version < "3.12"')
+
+    def test_url(self):
+        p = Package('foo @ git+https://x.org/foo.git@v1 ; sys_platform == "linux"')
+        self.assertEqual(p.url, "git+https://x.org/foo.git@v1")
+        self.assertEqual(p.marker, 'sys_platform == "linux"')
+        self.assertEqual(
+            p.requirement(">=", "2"),
+            'foo @ git+https://x.org/foo.git@v1 ; sys_platform == "linux"',
+        )
+
+    def test_multiple_specs(self):
+        p = Package("foo >= 1.0, != 1.5, < 2")
+        self.assertEqual(p.specs, [(">=", "1.0"), ("!=", "1.5"), ("<", "2")])
+        self.assertEqual(p.requirement(), "foo>=1.0,!=1.5,<2")
+        self.assertEqual(p.requirement(clear=True), "foo!=1.5,<2")
+        self.assertEqual(p.requirement("==", "1.7"), "foo==1.7,!=1.5,<2")
+
+    def test_editable(self):
+        p = Package("-e git+https://x.org/foo.git#egg=foo")
+        self.assertTrue(p.editable)
+        self.assertEqual(p.package, "foo")
+
+    def test_invalid(self):
+        with self.assertRaises(Exception):
+            Package("foo=>1")
+
+    def test_bump(self):
+        packs = {
+            "foo": Package.from_installed("foo", "1.7"),
+            "bar": Package.from_installed("bar", "3.0"),
+        }
+        reqs = ["foo!=1.5,<2", "bar[x]; os_name == 'posix'", "baz", "-r other.txt"]
+        self.assertEqual(
+            bump_versions(reqs, packs).splitlines(),
+            [
+                "foo>=1.7,!=1.5,<2",
+                "bar[x]>=3.0; os_name == 'posix'",
+                "baz",
+                "-r other.txt",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -41,7 +41,8 @@ call a program within the venv
 
 
 hint:
-with 'run' all rest opts are passed to the next tool
+with 'run' all rest opts are passed to the next tool.
+the opts of 'run' itself are given before the cmd-line
 
 e.g.
 python3 xvenv.py run python3 -c "import os; print('hello')"
@@ -65,13 +66,9 @@ https://github.com/kr-g/xvenv/
 
 import sys
 import os
-import glob
 from functools import wraps
 import argparse
-import subprocess
-import tempfile
-import shutil
-import shlex
+import time
 
 VERSION = "v0.0.0"
 
@@ -89,9 +86,13 @@ VENV = ".venv"
 PYTHON = "python3"
 PIP = "pip"
 TEMPRUN = "e_n_v_i.sh"
+KILL_GRACE = 5
+TIMEOUT_RC = 124
 
 shell_ = "/bin/bash"
 shell_opts_ = "-l"
+use_shell = False
+timeout_ = None
 args = None
 debug = False
 verbose = False
@@ -101,6 +102,12 @@ keep_temp = False
 cwd = "."
 ewd = "."
 cdvenv = False
+cache_dir_ = os.environ.get(
+    "XVENV_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "xvenv")
+)
+cache_size_ = 2048  # MB
+log_tail_ = 40
+step_log = None
 
 
 def dprint(*args_, **kwargs_):
@@ -115,44 +122,382 @@ def eprint(*args_, **kwargs_):
     print(*args_, **kwargs_, file=sys.stderr)
 
 
+class Profiler(object):
+    """records spans of steps and child processes in chrome trace-event format"""
+
+    def __init__(self, fnam):
+        self.fnam = fnam
+        self.events = []
+        self.pid = os.getpid()
+        self.t0 = time.perf_counter()
+        self.lanes = set()
+
+    def now(self):
+        return (time.perf_counter() - self.t0) * 1e6
+
+    @staticmethod
+    def usage():
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def acquire_lane(self):
+        """trace lane for a child process, parallel processes get own lanes"""
+        lane = 1
+        while lane in self.lanes:
+            lane += 1
+        self.lanes.add(lane)
+        return lane
+
+    def release_lane(self, lane):
+        self.lanes.discard(lane)
+
+    def span(self, name, cat, start, usage, tid=0, **kwargs):
+        end = self.now()
+        after = self.usage()
+        kwargs.update(
+            {
+                "cpu_user": round(after.ru_utime - usage.ru_utime, 6),
+                "cpu_sys": round(after.ru_stime - usage.ru_stime, 6),
+                "max_rss_kb": after.ru_maxrss,
+            }
+        )
+        self.events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": start,
+                "dur": end - start,
+                "pid": self.pid,
+                "tid": tid,
+                "args": kwargs,
+            }
+        )
+
+    def write(self):
+        import json
+
+        meta = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self.pid,
+                "tid": tid,
+                "args": {"name": "steps" if tid == 0 else f"procs {tid}"},
+            }
+            for tid in sorted(set(map(lambda x: x["tid"], self.events)))
+        ]
+        with open(self.fnam, "w") as f:
+            json.dump({"traceEvents": meta + self.events, "displayTimeUnit": "ms"}, f)
+        print("profile written to", self.fnam)
+
+
+profiler = None
+
+
 def trprint(func):
     def _w():
         @wraps(func)
         def __w(*a, **kw):
+            if profiler is not None:
+                start = profiler.now()
+                usage = profiler.usage()
+            rc = None
             try:
                 dprint("*TRACE*", "enter", func.__name__, a, kw)
-                return func(*a, *kw)
+                rc = func(*a, **kw)
+                return rc
             finally:
                 dprint("*TRACE*", "leave", func.__name__, a, kw)
+                if profiler is not None:
+                    if rc is not None and type(rc) not in [int, bool]:
+                        rc = type(rc).__name__
+                    profiler.span(func.__name__, "step", start, usage, rc=rc)
 
         return __w
 
     return _w()
 
 
-@trprint
-def proc(args_):
-    proc = subprocess.Popen(
-        args_,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
-    dprint("proc.returncode", proc.returncode)
-    if proc:
+class ProcResult(object):
+    """result of a child process"""
+
+    def __init__(self, args_):
+        self.args = args_
+        self.returncode = None
+        self.stdout = b""
+        self.stderr = b""
+        self.timeout = False
+        self.duration = 0
+
+    @property
+    def rc(self):
+        """return code as used by the sub-cmds, None on success"""
+        return self.returncode if self.returncode else None
+
+
+class OutputWriter(object):
+    """writes the output chunks of a child process, with prefix for each line"""
+
+    def __init__(self, stream, prefix=None):
+        self.stream = stream.buffer if hasattr(stream, "buffer") else stream
+        self.prefix = None if prefix is None else f"[{prefix}] ".encode()
+        self.bol = True
+
+    def write(self, buf):
+        if not (debug or verbose):
+            return
+        if self.prefix is not None:
+            out = []
+            for line in buf.splitlines(keepends=True):
+                if self.bol:
+                    out.append(self.prefix)
+                out.append(line)
+                self.bol = line.endswith(b"\n")
+            buf = b"".join(out)
+        self.stream.write(buf)
+        self.stream.flush()
+
+
+class StepLog(object):
+    """output of the child processes of a step, written gzip compressed to
+    .venv/.xvenv/logs/STEP.log.gz. only the last lines are kept in memory,
+    and printed if the step fails and the output was not shown"""
+
+    def __init__(self, name, tail=None):
+        import collections
+
+        self.name = name
+        self.ring = collections.deque(maxlen=log_tail_ if tail is None else tail)
+        self.fnam = None
+        self.f = None
+        self.hidden = False
+
+    def __enter__(self):
+        global step_log
+        self.prev = step_log
+        step_log = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global step_log
+        step_log = self.prev
+        if exc_type is SystemExit and not exc_value.code:
+            exc_type = None
+        if exc_type is not None:
+            self.print_tail()
+        self.close()
+
+    def stream(self, prefix=None):
+        return StepLogStream(self, prefix)
+
+    def add(self, line, echoed):
+        import gzip
+        import tempfile
+
+        if self.f is None:
+            # the venv might not exist yet, moved into place when closed
+            fd, self.fnam = tempfile.mkstemp(prefix="xvenv-", suffix=".log.gz")
+            # fast compression, the logs are not archived
+            self.f = gzip.GzipFile(
+                mode="wb", fileobj=os.fdopen(fd, "wb"), compresslevel=1
+            )
+        self.f.write(line)
+        self.ring.append(line)
+        self.hidden = self.hidden or not echoed
+
+    def print_tail(self):
+        if not self.hidden or len(self.ring) == 0:
+            return
+        eprint(
+            f"last {len(self.ring)} lines of {self.name}, see 'xvenv logs {self.name}'"
+        )
+        out = sys.stderr.buffer if hasattr(sys.stderr, "buffer") else sys.stderr
+        for line in self.ring:
+            out.write(line)
+        out.flush()
+        # printed once, also if nested steps fail
+        self.hidden = False
+
+    def close(self):
+        import shutil
+
+        if self.f is None:
+            return
+        fileobj = self.f.fileobj
+        self.f.close()
+        fileobj.close()
+        self.f = None
+        logs = os.path.join(xvenv_dir(), "logs")
+        if os.path.isdir(VENV):
+            os.makedirs(logs, exist_ok=True)
+            shutil.move(self.fnam, os.path.join(logs, f"{self.name}.log.gz"))
+        else:
+            os.remove(self.fnam)
+
+
+class StepLogStream(object):
+    """splits the output chunks of a child process into lines for the step log"""
+
+    def __init__(self, log, prefix=None):
+        self.log = log
+        self.prefix = b"" if prefix is None else f"[{prefix}] ".encode()
+        self.partial = b""
+
+    def write(self, buf):
+        lines = (self.partial + buf).split(b"\n")
+        self.partial = lines.pop()
+        echoed = debug or verbose
+        for line in lines:
+            self.log.add(self.prefix + line + b"\n", echoed)
+
+    def close(self):
+        if len(self.partial) > 0:
+            self.log.add(self.prefix + self.partial + b"\n", debug or verbose)
+            self.partial = b""
+
+
+async def terminate(p, group=True, grace=KILL_GRACE):
+    """SIGTERM to the process (group), SIGKILL after grace seconds"""
+    import asyncio
+    import signal
+
+    def kill(sig):
+        try:
+            if group:
+                os.killpg(p.pid, sig)
+            else:
+                p.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+    if p.returncode is not None:
+        return
+    kill(signal.SIGTERM)
+    try:
+        await asyncio.wait_for(p.wait(), grace)
+    except asyncio.TimeoutError:
+        dprint("kill", p.pid)
+        kill(signal.SIGKILL)
+        await p.wait()
+
+
+async def pump(stream, out=None, chunks=None, prefix=None):
+    """copies the output of a child process to out with prefixed lines,
+    and into the step log. chunks collects the output if given"""
+    writer = None if out is None else OutputWriter(out, prefix)
+    log = None if step_log is None else step_log.stream(prefix)
+    try:
         while True:
-            outs = proc.stdout.readline().decode()
-            if len(outs) == 0:
+            buf = await stream.read(64 * 1024)
+            if len(buf) == 0:
                 break
-            vprint(outs, end="")
+            if chunks is not None:
+                chunks.append(buf)
+            if writer is not None:
+                writer.write(buf)
+            if log is not None:
+                log.write(buf)
+    finally:
+        if log is not None:
+            log.close()
+
+
+async def aproc(
+    args_,
+    env=None,
+    cwd=None,
+    passthru=False,
+    prefix=None,
+    timeout=None,
+    capture=False,
+    quiet=False,
+):
+    """run a child process, and stream stdout and stderr separately.
+    passthru inherits stdin, stdout, and stderr. quiet only captures"""
+    import shlex
+    import asyncio
+
+    res = ProcResult(args_)
+    start = time.time()
+    if profiler is not None:
+        pstart = profiler.now()
+        usage = profiler.usage()
+    pipe = None if passthru else asyncio.subprocess.PIPE
+    # own process group, except for interactive use
+    group = not passthru
+    p = await asyncio.create_subprocess_exec(
+        *args_, stdout=pipe, stderr=pipe, env=env, cwd=cwd, start_new_session=group
+    )
+    dprint("proc.pid", p.pid)
+    if profiler is not None:
+        lane = profiler.acquire_lane()
+
+    out = []
+    err = []
+    tasks = [p.wait()]
+    if not passthru:
+        keep = capture or quiet
+        tasks.append(
+            pump(p.stdout, None if quiet else sys.stdout, out if keep else None, prefix)
+        )
+        tasks.append(
+            pump(p.stderr, None if quiet else sys.stderr, err if keep else None, prefix)
+        )
 
-    proc.wait()
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout)
+    except asyncio.TimeoutError:
+        eprint("timeout after", timeout, "seconds", *args_[:3])
+        res.timeout = True
+        await terminate(p, group)
+    except asyncio.CancelledError:
+        await terminate(p, group)
+        raise
+    finally:
+        if profiler is not None:
+            profiler.release_lane(lane)
+            profiler.span(
+                shlex.join([os.path.basename(args_[0]), *args_[1:3]]),
+                "proc",
+                pstart,
+                usage,
+                tid=lane,
+                cmd=args_,
+                rc=TIMEOUT_RC if res.timeout else p.returncode,
+                timeout=res.timeout,
+            )
+
+    res.returncode = TIMEOUT_RC if res.timeout else p.returncode
+    res.stdout = b"".join(out)
+    res.stderr = b"".join(err)
+    res.duration = time.time() - start
+    dprint("done proc.returncode", res.returncode)
+    return res
+
+
+async def run_many(specs, jobs):
+    """run the child processes with at most jobs in parallel.
+    specs are kwargs of aproc. returns a list of ProcResult"""
+    import asyncio
+
+    sem = asyncio.Semaphore(max(1, jobs))
+
+    async def one(spec):
+        async with sem:
+            return await aproc(**spec)
+
+    return await asyncio.gather(*[one(spec) for spec in specs])
 
-    dprint("done proc.returncode", proc.returncode)
 
-    if proc.returncode == 0:
-        return
+@trprint
+def proc(args_, env=None, cwd=None, passthru=False, prefix=None, timeout=None):
+    import asyncio
 
-    return proc.returncode
+    timeout = timeout_ if timeout is None else timeout
+    res = asyncio.run(aproc(args_, env, cwd, passthru, prefix, timeout))
+    return res.rc
 
 
 @trprint
@@ -180,8 +525,9 @@ def bashwrap(cmd):
     return wrap
 
 
-@trprint
-def extrun(cmd):
+def write_temp(cmd):
+    import tempfile
+
     # fnam = os.path.join(tempfile.gettempdir(), TEMPRUN)
     fd, fnam = tempfile.mkstemp(prefix="xvenv-", suffix=".sh")
     os.close(fd)
@@ -191,22 +537,97 @@ def extrun(cmd):
     with open(fnam, "w") as f:
         f.write(cmd)
 
+    return fnam
+
+
+def remove_temp(fnam):
+    if not keep_temp:
+        os.remove(fnam)
+    else:
+        print("keep_temp", fnam)
+
+
+@trprint
+def extrun(cmd, prefix=None):
+    fnam = write_temp(cmd)
+
     rc = proc(
         [
             shell_,
             *shell_opts_.split(),
             fnam,
-        ]
+        ],
+        prefix=prefix,
     )
 
-    if not keep_temp:
-        os.remove(fnam)
-    else:
-        print("keep_temp", fnam)
+    remove_temp(fnam)
 
     return rc
 
 
+def venv_env():
+    """returns the environment and working folder of the activated venv,
+    same as sourcing bin/activate but without a shell"""
+    base = os.path.abspath(ewd) if cdvenv else os.getcwd()
+    venv = os.path.normpath(os.path.join(base, ewd, VENV))
+    workdir = os.path.normpath(os.path.join(base, cwd))
+
+    env = dict(os.environ)
+    env.pop("PYTHONHOME", None)
+    env["VIRTUAL_ENV"] = venv
+    env["PATH"] = os.pathsep.join([os.path.join(venv, "bin"), env.get("PATH", "")])
+    return env, workdir
+
+
+@trprint
+def venv_spec(cmd):
+    """returns the kwargs of aproc for running cmd within the venv,
+    or the return code on error"""
+    import shutil
+    import shlex
+
+    if use_shell:
+        if type(cmd) == list:
+            cmd = shlex.join(cmd)
+        fnam = write_temp(bashwrap(cmd))
+        return {"args_": [shell_, *shell_opts_.split(), fnam], "temp": fnam}
+
+    if type(cmd) == str:
+        cmd = shlex.split(cmd)
+    if len(cmd) == 0:
+        eprint("no command given")
+        return 2
+
+    env, workdir = venv_env()
+    if not os.path.isdir(os.path.join(env["VIRTUAL_ENV"], "bin")):
+        eprint("venv not found", env["VIRTUAL_ENV"])
+        return 1
+
+    exe = cmd[0]
+    if os.sep not in exe:
+        exe = shutil.which(exe, path=env["PATH"])
+        if exe is None:
+            eprint("command not found", cmd[0])
+            return 127
+
+    return {"args_": [exe, *cmd[1:]], "env": env, "cwd": workdir}
+
+
+@trprint
+def venvrun(cmd, passthru=False, prefix=None):
+    """run cmd within the venv.
+    either by direct execution (default), or with login shell and bin/activate"""
+    spec = venv_spec(cmd)
+    if type(spec) == int:
+        return spec
+    temp = spec.pop("temp", None)
+    try:
+        return proc(**spec, passthru=passthru, prefix=prefix)
+    finally:
+        if temp is not None:
+            remove_temp(temp)
+
+
 @trprint
 def no_rest_or_die(args_):
     if len(args_.rest) > 0:
@@ -219,10 +640,22 @@ def setup(args_):
     no_rest_or_die(args_)
 
     clear = "--clear" if args_.clear else ""
-    copy = "--copies" if args_.copy else "--symlink"
     os.chdir(cwd)
-    cmd = f"{args_.python} -m venv {VENV} {clear} {copy}".split()
+
+    if args_.func is setup and args_.cache and cache_restore(args_):
+        return
+
+    if args_.clear and os.path.isdir(VENV):
+        # faster than venv --clear
+        reap(trash(VENV), wait=args_.wait)
+        clear = ""
+
+    # copies of the interpreter are made afterwards, with reflinks if possible
+    cmd = f"{args_.python} -m venv {VENV} {clear} --symlinks".split()
     rc = proc(cmd)
+    if rc is None and args_.copy:
+        engine = copy_interpreter(VENV)
+        vprint("copied interpreter", engine.summary())
     return rc
 
 
@@ -230,11 +663,11 @@ def setup(args_):
 def pip(args_):
     no_rest_or_die(args_)
 
-    cmd = bashwrap(f"{args_.python} -m ensurepip -U")
-    or_die_with_mesg(extrun(cmd), "ensurepip failed")
+    rc = venvrun(f"{args_.python} -m ensurepip -U")
+    or_die_with_mesg(rc, "ensurepip failed")
 
-    cmd = bashwrap(f"{args_.python} -m pip install pip -U")
-    rc = extrun(cmd)
+    wheels = wheelhouse_opts(args_)
+    rc = venvrun(f"{args_.python} -m pip install pip -U {wheels}")
     return rc
 
 
@@ -245,11 +678,16 @@ def req(args_):
     if args_.no_req_update:
         return
 
+    if not os.path.exists("requirements.txt"):
+        return
+
+    if getattr(args_, "lock", False) or getattr(args_, "relock", False):
+        return req_locked(args_)
+
     UPDATE = "-U" if args_.update_req else ""
-    if os.path.exists("requirements.txt"):
-        cmd = bashwrap(f"{args_.python} -m pip install -r requirements.txt {UPDATE}")
-        rc = extrun(cmd)
-        return rc
+    wheels = wheelhouse_opts(args_)
+    rc = venvrun(f"{args_.python} -m pip install -r requirements.txt {UPDATE} {wheels}")
+    return rc
 
 
 def tools(args_):
@@ -264,20 +702,652 @@ def tools(args_):
         eprint("can't update and uninstall at the same time")
         sys.exit(1)
 
-    cmd = bashwrap(f"{args_.python} -m pip {un}install {yes} {tools} {update}")
-    rc = extrun(cmd)
+    wheels = wheelhouse_opts(args_) if un == "" else ""
+    rc = venvrun(f"{args_.python} -m pip {un}install {yes} {tools} {update} {wheels}")
+    return rc
+
+
+def constraints_file(args_):
+    fnam = getattr(args_, "constraint", None)
+    if fnam is None and os.path.exists("constraints.txt"):
+        fnam = "constraints.txt"
+    return fnam
+
+
+@trprint
+def deps(args_):
+    """install tools and requirements.txt with a single pip resolver run"""
+    import shlex
+
+    no_rest_or_die(args_)
+
+    tools = " ".join(args_.tool)
+    update = "-U" if args_.update_deps or args_.update_req else ""
+    reqs = ""
+    if os.path.exists("requirements.txt") and not args_.no_req_update:
+        reqs = "-r requirements.txt"
+    constraint = constraints_file(args_)
+    constraint = f"-c {shlex.quote(constraint)}" if constraint else ""
+
+    if len(tools + reqs) == 0:
+        return
+
+    wheels = wheelhouse_opts(args_)
+    rc = venvrun(
+        f"{args_.python} -m pip install {tools} {reqs} {constraint} {update} {wheels}"
+    )
     return rc
 
 
+#
+# lock files
+#
+# a lock holds the fully resolved set of requirements.txt, pinned with hashes.
+# it is stored in folder 'locks' below the cache folder, keyed by the content
+# of requirements.txt, the constraints, and the interpreter.
+#
+
+
+def lock_key(args_):
+    import hashlib
+
+    info = interpreter_info(args_.python)
+    if info is None:
+        return
+    h = hashlib.sha256()
+    h.update(info.encode())
+    h.update(b"\0")
+    file_digest("requirements.txt", h)
+    constraint = constraints_file(args_)
+    if constraint and os.path.exists(constraint):
+        h.update(b"\0")
+        file_digest(constraint, h)
+    return h.hexdigest()
+
+
+def lock_lines(report):
+    """requirement lines from the pip install report.
+    with hashes only if all packages have one"""
+    lines = []
+    hashes = []
+    for item in report.get("install", []):
+        meta = item["metadata"]
+        info = item.get("download_info", {})
+        sha256 = info.get("archive_info", {}).get("hashes", {}).get("sha256")
+        if item.get("is_direct"):
+            lines.append(f"{meta['name']} @ {info['url']}")
+        else:
+            lines.append(f"{meta['name']}=={meta['version']}")
+        hashes.append(sha256)
+    if None not in hashes:
+        lines = [f"{line} --hash=sha256:{h}" for line, h in zip(lines, hashes)]
+    return sorted(lines, key=lambda x: x.lower())
+
+
+@trprint
+def lock_create(args_, fnam):
+    """resolve requirements.txt without installing, and write the lock"""
+    import json
+    import shlex
+    import tempfile
+
+    fd, report = tempfile.mkstemp(prefix="xvenv-", suffix=".json")
+    os.close(fd)
+    cmd = [args_.python, "-m", "pip", "install", "-q", "--dry-run"]
+    cmd.extend(["--ignore-installed", "--report", report, "-r", "requirements.txt"])
+    constraint = constraints_file(args_)
+    if constraint:
+        cmd.extend(["-c", constraint])
+    cmd.extend(shlex.split(wheelhouse_opts(args_)))
+    try:
+        rc = venvrun(cmd)
+        if rc:
+            return rc
+        with open(report) as f:
+            lines = lock_lines(json.load(f))
+    finally:
+        remove_temp(report)
+
+    os.makedirs(os.path.dirname(fnam), exist_ok=True)
+    tmp = f"{fnam}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(f"# xvenv lock of {os.path.abspath('requirements.txt')}\n")
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, fnam)
+    print("locked", len(lines), "packages")
+
+
+@trprint
+def req_locked(args_):
+    """install the locked set of requirements.txt without resolving"""
+    import shlex
+
+    key = lock_key(args_)
+    if key is None:
+        eprint("python not found", args_.python)
+        return 1
+    fnam = os.path.join(cache_dir_, "locks", key + ".txt")
+
+    if args_.relock or args_.update_req or not os.path.exists(fnam):
+        vprint("lock", key)
+        rc = lock_create(args_, fnam)
+        if rc:
+            return rc
+    else:
+        vprint("use lock", key)
+
+    cmd = [args_.python, "-m", "pip", "install", "--no-deps", "-r", fnam]
+    return venvrun([*cmd, *shlex.split(wheelhouse_opts(args_))])
+
+
+#
+# wheelhouse
+#
+
+
+def wheelhouse_dir():
+    return os.path.join(cache_dir_, "wheelhouse")
+
+
+def wheelhouse_opts(args_):
+    """pip opts for installing from the wheelhouse without index access"""
+    import shlex
+
+    wheels = getattr(args_, "wheelhouse", None)
+    if wheels is None:
+        return ""
+    if wheels == "":
+        wheels = wheelhouse_dir()
+    return f"--no-index --find-links {shlex.quote(os.path.abspath(wheels))}"
+
+
+def venv_abi():
+    import subprocess
+
+    env, _ = venv_env()
+    rc = subprocess.run(
+        [
+            os.path.join(env["VIRTUAL_ENV"], "bin", "python"),
+            "-c",
+            "import sys, sysconfig; print(sysconfig.get_config_var('SOABI') or sys.implementation.cache_tag)",
+        ],
+        capture_output=True,
+    )
+    if rc.returncode:
+        return
+    return rc.stdout.decode().strip()
+
+
+def move_files(src, dest):
+    for fnam in os.listdir(src):
+        target = os.path.join(dest, fnam)
+        if os.path.exists(target):
+            os.remove(os.path.join(src, fnam))
+            continue
+        os.replace(os.path.join(src, fnam), target)
+
+
+@trprint
+def wheelhouse(args_):
+    """download wheels for requirements.txt and tools, and build the sdists once"""
+    import glob
+    import tempfile
+    import shutil
+    import shlex
+    import json
+
+    no_rest_or_die(args_)
+
+    dest = os.path.abspath(args_.dir or wheelhouse_dir())
+    jobs = args_.jobs if args_.jobs > 0 else os.cpu_count()
+    abi = venv_abi()
+    if abi is None:
+        eprint("venv not found, run setup before")
+        return 1
+
+    # a single resolver run for all packages. requirements.txt is passed
+    # as is, with its -r, -c, -e lines and index opts
+    specs = ["pip", *args_.tool]
+    if os.path.exists("requirements.txt"):
+        specs.extend(["-r", "requirements.txt"])
+    constraint = constraints_file(args_)
+    if constraint:
+        specs.extend(["-c", constraint])
+    print("wheelhouse", dest, "jobs", jobs)
+
+    tmp = tempfile.mkdtemp(prefix="xvenv-wheels-")
+    try:
+        dl = os.path.join(tmp, "download")
+        os.makedirs(dl)
+        cmd = [args_.python, "-m", "pip", "download", "-q", "-d", dl, *specs]
+        with VerboseOn():
+            rc = venvrun(shlex.join(cmd))
+        if rc:
+            eprint("download failed")
+            return 1
+
+        os.makedirs(dest, exist_ok=True)
+        move_files(dl, dest)
+
+        # build each sdist once, keyed by sdist hash and interpreter abi
+        built = os.path.join(dest, ".built")
+        os.makedirs(built, exist_ok=True)
+        cmds = []
+        markers = []
+        for fnam in sorted(os.listdir(dest)):
+            if not (fnam.endswith(".tar.gz") or fnam.endswith(".zip")):
+                continue
+            sdist = os.path.join(dest, fnam)
+            key = f"{file_digest(sdist).hexdigest()}-{abi}"
+            marker = os.path.join(built, key + ".json")
+            if os.path.exists(marker):
+                dprint("already built", fnam)
+                continue
+            out = os.path.join(tmp, "build", key)
+            os.makedirs(out)
+            cmds.append(
+                (
+                    f"build.{len(cmds)}",
+                    f"{args_.python} -m pip wheel -q --no-deps -w {shlex.quote(out)} --find-links {shlex.quote(dest)} {shlex.quote(sdist)}",
+                )
+            )
+            markers.append((fnam, out, marker))
+
+        if len(cmds) > 0:
+            print("building", len(cmds), "sdists")
+            with VerboseOn():
+                rcs = run_parallel(cmds, jobs)
+            for (fnam, out, marker), rc in zip(markers, rcs):
+                if rc:
+                    eprint("build failed", fnam)
+                    continue
+                wheels = sorted(os.listdir(out))
+                move_files(out, dest)
+                with open(marker, "w") as f:
+                    json.dump({"sdist": fnam, "abi": abi, "wheels": wheels}, f)
+            if any(rcs):
+                return 1
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print("wheelhouse ready", len(glob.glob(os.path.join(dest, "*.whl"))), "wheels")
+
+
+#
+# matrix
+#
+
+
+def python_version(python):
+    import subprocess
+
+    try:
+        rc = subprocess.run(
+            [python, "-c", "import sys; print('%d.%d' % sys.version_info[:2])"],
+            capture_output=True,
+        )
+    except OSError:
+        return
+    if rc.returncode:
+        return
+    return rc.stdout.decode().strip()
+
+
+def global_opts():
+    """cmd-line opts for calling xvenv in a sub process with the same settings"""
+    opts = [f"-cwd={cwd}", f"-ewd={ewd}", f"-sh={shell_}", f"-sh-opts={shell_opts_}"]
+    opts.extend([f"-cache-dir={cache_dir_}", f"-cache-size={cache_size_}"])
+    if verbose:
+        opts.append("-V")
+    if debug:
+        opts.append("-d")
+    if cdvenv:
+        opts.append("-cdvenv")
+    if use_shell:
+        opts.append("-use-shell")
+    if keep_temp:
+        opts.append("-kt")
+    if timeout_ is not None:
+        opts.append(f"-timeout={timeout_}")
+    return opts
+
+
+def xvenv_cmd():
+    return [sys.executable, os.path.abspath(__file__)]
+
+
+def print_table(header, rows):
+    rows = [list(map(str, r)) for r in [header, *rows]]
+    widths = [max(map(len, col)) for col in zip(*rows)]
+    for row in rows:
+        print("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+
+
+@trprint
+def matrix(args_):
+    """run a sub-cmd for each interpreter in its own venv, in parallel"""
+    import asyncio
+
+    jobs = args_.jobs if args_.jobs > 0 else os.cpu_count()
+    opts = global_opts()
+
+    results = []
+    specs = []
+    for python in args_.interpreters:
+        version = python_version(python)
+        if version is None:
+            results.append([python, "-", "not found", 0])
+            continue
+        venv = f"{VENV}-{version}"
+        cmd = [
+            *xvenv_cmd(),
+            *opts,
+            "-python",
+            python,
+            "-venv-name",
+            venv,
+            args_.step,
+            *args_.rest,
+        ]
+        results.append([python, venv, None, 0])
+        specs.append((results[-1], {"args_": cmd, "prefix": version}))
+
+    print("matrix", args_.step, *args_.rest, "jobs", jobs)
+    with VerboseOn():
+        procs = asyncio.run(run_many([spec for r, spec in specs], jobs))
+    for (row, spec), res in zip(specs, procs):
+        row[2] = res.returncode
+        row[3] = res.duration
+
+    print()
+    print_table(
+        ["python", "venv", "rc", "duration"],
+        [[p, v, rc, f"{d:.1f}s"] for p, v, rc, d in results],
+    )
+    if any(map(lambda x: x[2] != 0, results)):
+        return 1
+
+
+#
+# workspace
+#
+
+WORKSPACE_MARKERS = ["setup.py", "requirements.txt"]
+
+
+def workspace_projects(root):
+    """folders below root with setup.py or requirements.txt.
+    venv folders, hidden folders, and sub folders of projects are not searched"""
+    projects = []
+    dirs = [root]
+    while len(dirs) > 0:
+        path = dirs.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = [e for e in it if e.is_dir(follow_symlinks=False)]
+        except OSError as ex:
+            report(path, ex)
+            continue
+        for entry in entries:
+            if entry.name.startswith(".") or entry.name in [VENV, "build", "dist"]:
+                continue
+            if os.path.exists(os.path.join(entry.path, "pyvenv.cfg")):
+                continue
+            if any(
+                os.path.exists(os.path.join(entry.path, m)) for m in WORKSPACE_MARKERS
+            ):
+                projects.append(entry.path)
+            else:
+                dirs.append(entry.path)
+    return sorted(projects)
+
+
+def workspace_status(rows, drawn):
+    """redraws the status table in place on a terminal. returns lines drawn"""
+    now = time.time()
+    lines = []
+    for name, state, start, duration in rows:
+        if state == "running":
+            duration = now - start
+        secs = f"{duration:.1f}s" if duration is not None else ""
+        lines.append(f"{name:40} {state:8} {secs:>8}")
+    if drawn > 0:
+        sys.stdout.write(f"\x1b[{drawn}A")
+    for line in lines:
+        sys.stdout.write("\x1b[2K" + line + "\n")
+    sys.stdout.flush()
+    return len(lines)
+
+
+async def workspace_run(specs, rows, jobs):
+    import asyncio
+
+    sem = asyncio.Semaphore(max(1, jobs))
+    tty = sys.stdout.isatty()
+
+    async def one(spec, row):
+        async with sem:
+            row[1] = "running"
+            row[2] = time.time()
+            res = await aproc(**spec)
+            row[1] = "ok" if res.returncode == 0 else "failed"
+            row[3] = res.duration
+            if not tty:
+                print(row[0], row[1], f"{row[3]:.1f}s", flush=True)
+            return res
+
+    task = asyncio.ensure_future(
+        asyncio.gather(*[one(spec, row) for spec, row in zip(specs, rows)])
+    )
+    drawn = 0
+    while not task.done():
+        if tty:
+            drawn = workspace_status(rows, drawn)
+        await asyncio.wait([task], timeout=0.5)
+    if tty:
+        workspace_status(rows, drawn)
+    return task.result()
+
+
+@trprint
+def workspace(args_):
+    """run make, qtest, or run for all projects below a folder in parallel"""
+    import asyncio
+
+    root = os.path.abspath(args_.dir)
+    jobs = args_.jobs if args_.jobs > 0 else os.cpu_count()
+    projects = workspace_projects(root)
+    if len(projects) == 0:
+        eprint("no projects found in", root)
+        return 1
+
+    # the user's pip cache and the venv cache are shared by all projects
+    env = dict(os.environ)
+    env.pop("VIRTUAL_ENV", None)
+    if args_.wheelhouse is not None:
+        wheels = os.path.abspath(args_.wheelhouse or wheelhouse_dir())
+        env["PIP_FIND_LINKS"] = " ".join(
+            filter(lambda x: len(x) > 0, [env.get("PIP_FIND_LINKS", ""), wheels])
+        )
+
+    cmd = [*xvenv_cmd(), *global_opts(), args_.step, *args_.rest]
+    rows = []
+    specs = []
+    for project in projects:
+        rows.append([os.path.relpath(project, root), "waiting", None, None])
+        specs.append(
+            {
+                "args_": cmd,
+                "env": env,
+                "cwd": project,
+                "timeout": timeout_,
+                "quiet": True,
+            }
+        )
+
+    print("workspace", args_.step, *args_.rest, "projects", len(projects), "jobs", jobs)
+    start = time.time()
+    procs = asyncio.run(workspace_run(specs, rows, jobs))
+
+    failed = 0
+    for row, res in zip(rows, procs):
+        if res.returncode == 0:
+            continue
+        failed += 1
+        print()
+        print("failed", row[0], "rc", res.returncode)
+        out = (res.stdout + res.stderr).decode(errors="replace").splitlines()
+        for line in out[-args_.tail :]:
+            print(f"[{row[0]}] {line}")
+
+    print()
+    print_table(
+        ["project", "rc", "duration"],
+        [
+            [row[0], res.returncode, f"{res.duration:.1f}s"]
+            for row, res in zip(rows, procs)
+        ],
+    )
+    print(
+        "projects",
+        len(projects),
+        "failed",
+        failed,
+        f"{time.time() - start:.1f}s",
+        f"(sequential {sum(map(lambda x: x.duration, procs)):.1f}s)",
+    )
+    if failed > 0:
+        return 1
+
+
+# build --build-clean removes only the build outputs
+BUILD_CLEAN_PATTERNS = [
+    "/build",
+    "/dist",
+    "/*.egg-info",
+]
+
+CLEAN_PATTERNS = [
+    *BUILD_CLEAN_PATTERNS,
+    "__pycache__",
+    ".pytest_cache",
+    "*.pyc",
+]
+
+
+def tree_stats(top):
+    """returns number of files and bytes below top"""
+    files = 0
+    size = 0
+    dirs = [top]
+    while len(dirs) > 0:
+        path = dirs.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                        continue
+                    files += 1
+                    size += entry.stat(follow_symlinks=False).st_size
+        except OSError as ex:
+            report(path, ex)
+    return files, size
+
+
+def clean_matches(root, patterns):
+    """single walk of the folder tree with os.scandir.
+    patterns starting with '/' match only in root, all others in any folder.
+    venv folders, .git, and the trash are not entered, nor matched folders.
+    returns the matched paths as lists of folders and files"""
+    import fnmatch
+
+    top_patterns = [p[1:] for p in patterns if p.startswith("/")]
+    any_patterns = [p for p in patterns if not p.startswith("/")]
+    skip = set([VENV, ".git", TRASH])
+
+    match_dirs = []
+    match_files = []
+    dirs = [root]
+    while len(dirs) > 0:
+        path = dirs.pop()
+        pats = any_patterns + (top_patterns if path == root else [])
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if is_dir and (
+                        entry.name in skip
+                        or os.path.exists(os.path.join(entry.path, "pyvenv.cfg"))
+                    ):
+                        continue
+                    if any(fnmatch.fnmatch(entry.name, p) for p in pats):
+                        (match_dirs if is_dir else match_files).append(entry.path)
+                    elif is_dir:
+                        dirs.append(entry.path)
+        except OSError as ex:
+            report(path, ex)
+    return match_dirs, match_files
+
+
+def clean_file(fnam):
+    try:
+        size = os.stat(fnam, follow_symlinks=False).st_size
+        os.unlink(fnam)
+        return 1, size
+    except FileNotFoundError:
+        pass
+    except OSError as ex:
+        report(fnam, ex)
+    return 0, 0
+
+
+def clean_dir(path, trash_dir):
+    stats = tree_stats(path)
+    try:
+        trash(path, trash_dir)
+    except OSError:
+        # trash on another file system
+        remove_tree(path)
+    return stats
+
+
 @trprint
-def clean(args_):
+def clean(args_, patterns=None):
     no_rest_or_die(args_)
 
-    for fld in ["build", "dist", "*.egg-info"]:
-        vprint("clean", fld)
-        for fnam in glob.iglob(fld):
-            dprint("clean", fnam)
-            shutil.rmtree(fnam, ignore_errors=False, onerror=report)
+    from concurrent.futures import ThreadPoolExecutor
+
+    root = os.getcwd()
+    if patterns is None:
+        patterns = getattr(args_, "pattern", None) or CLEAN_PATTERNS
+    vprint("clean", *patterns)
+
+    match_dirs, match_files = clean_matches(root, patterns)
+    for fnam in match_dirs + match_files:
+        dprint("clean", os.path.relpath(fnam, root))
+
+    if len(match_dirs) + len(match_files) == 0:
+        return
+
+    trash_dir = os.path.join(root, TRASH)
+    jobs = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(clean_file, match_files))
+        results.extend(pool.map(lambda x: clean_dir(x, trash_dir), match_dirs))
+
+    files = sum(map(lambda x: x[0], results))
+    size = sum(map(lambda x: x[1], results))
+    print(
+        "clean",
+        "removed",
+        f"{len(match_dirs)} folders",
+        f"{files} files",
+        f"{size / 1024 / 1024:.1f} MB",
+    )
+
+    if os.path.isdir(trash_dir):
+        reap(trash_dir, wait=getattr(args_, "wait", False))
 
 
 class VerboseOn(object):
@@ -292,32 +1362,119 @@ class VerboseOn(object):
         verbose = self.bak
 
 
+class ProjectLock(object):
+    """exclusive lock of the project folder for the steps writing into
+    the project tree, like build/, dist/, egg-info, or formating.
+    parallel runs of matrix do these steps one after the other"""
+
+    def __enter__(self):
+        import fcntl
+
+        self.fd = os.open(cwd, os.O_RDONLY)
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            vprint("waiting for the project lock")
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # closing releases the lock
+        os.close(self.fd)
+
+
 @trprint
 def build(args_):
     no_rest_or_die(args_)
 
-    with VerboseOn():
-        print("building...")
-        if args_.build_clean or args_.build_clean_only:
-            or_die_with_mesg(clean(args_), "build clean failed")
+    print("building...")
+    with ProjectLock():
+        return build_locked(args_)
+
+
+def build_locked(args_):
+    if args_.build_clean or args_.build_clean_only:
+        rc = clean(args_, BUILD_CLEAN_PATTERNS)
+        or_die_with_mesg(rc, "build clean failed")
 
-        if args_.build_clean_only:
+    if args_.build_clean_only:
+        return
+
+    os.environ.setdefault("SOURCE_DATE_EPOCH", source_date_epoch())
+
+    key = None
+    if getattr(args_, "cache", False):
+        key = build_key(args_)
+        if build_restore(key):
             return
 
-        cmd = bashwrap(f"{args_.python} -m setup sdist build bdist_wheel")
-        rc = extrun(cmd)
-        return rc
+    start = time.time()
+    if getattr(args_, "pep517", False):
+        rc = pep517_build(args_)
+    else:
+        rc = venvrun(f"{args_.python} -m setup sdist build bdist_wheel")
+    if rc is None and key is not None:
+        build_store(key, args_, start)
+    return rc
 
 
 @trprint
 def install(args_):
     no_rest_or_die(args_)
 
-    with VerboseOn():
-        print("installing...")
-        cmd = bashwrap(f"{args_.python} -m pip install -e .")
-        rc = extrun(cmd)
-        return rc
+    print("installing...")
+    with ProjectLock():
+        rc = venvrun(f"{args_.python} -m pip install -e .")
+    return rc
+
+
+@trprint
+def precompile(args_):
+    """compile the python files of site-packages and the project to pyc,
+    with all cores"""
+    import tempfile
+
+    no_rest_or_die(args_)
+
+    dirs = site_packages_dirs()
+    if len(dirs) == 0:
+        eprint("venv not found, run setup before")
+        return 1
+    files = python_files(".", getattr(args_, "exclude", None))
+    count = len(files)
+    for sp in dirs:
+        count += len(python_files(sp))
+
+    levels = getattr(args_, "opt", None) or [0]
+    mode = getattr(args_, "invalidation_mode", None)
+    jobs = getattr(args_, "jobs", 0)
+
+    fd, lst = tempfile.mkstemp(prefix="xvenv-", suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        f.write("\n".join(files))
+
+    cmd = [args_.python, "-m", "compileall", "-q", "-j", str(jobs)]
+    for level in levels:
+        cmd.extend(["-o", str(level)])
+    if mode:
+        cmd.extend(["--invalidation-mode", mode])
+    cmd.extend(["-i", lst, *dirs])
+
+    print("compiling...")
+    start = time.time()
+    try:
+        rc = venvrun(cmd)
+    finally:
+        remove_temp(lst)
+    print(
+        "compiled",
+        count,
+        "files",
+        "opt",
+        ",".join(map(str, levels)),
+        f"{time.time() - start:.1f}s",
+    )
+    return rc
 
 
 @trprint
@@ -353,78 +1510,781 @@ def or_die_with_mesg(rc, text=None):
         sys.exit(1)
 
 
-@trprint
-def make(args_):
-    no_rest_or_die(args_)
+#
+# step manifest
+#
 
-    print("making...")
 
-    or_die_with_mesg(setup(args_), "setup failed")
-    or_die_with_mesg(pip(args_), "pip failed")
-    or_die_with_mesg(tools(args_), "tools failed")
-    or_die_with_mesg(req(args_), "req failed")
+class StepManifest(object):
+    """input fingerprints of the make steps, stored inside the venv"""
 
-    if args.quick:
-        return
+    def __init__(self, fnam, force=False):
+        self.fnam = fnam
+        self.force = force
+        self.steps = {}
+        self.reused = []
+        self.load()
 
-    or_die_with_mesg(test(args_), "test failed")
-    or_die_with_mesg(build(args_), "build failed")
-    or_die_with_mesg(install(args_), "install failed")
+    def load(self):
+        import json
 
+        try:
+            with open(self.fnam) as f:
+                self.steps = json.load(f)
+        except (OSError, ValueError):
+            self.steps = {}
 
-@trprint
-def run(args_):
+    def save(self):
+        import json
 
-    with VerboseOn():
-        rest = shlex.join(args_.rest)
-        cmd = bashwrap(f"{rest}")
-        rc = extrun(cmd)
-        return rc
+        os.makedirs(os.path.dirname(self.fnam), exist_ok=True)
+        with open(self.fnam, "w") as f:
+            json.dump(self.steps, f, indent=4)
 
+    def clear(self):
+        # the durations are kept for comparing deps with tools and req
+        self.steps = {
+            k: {"duration": v["duration"]}
+            for k, v in self.steps.items()
+            if v.get("duration") is not None
+        }
 
-@trprint
-def test(args_):
-    no_rest_or_die(args_)
+    @staticmethod
+    def fingerprint(*inputs):
+        import json
+        import hashlib
 
-    with VerboseOn():
-        cmd = bashwrap(
-            f"{args_.python} -c 'import os; import pip; print(pip.__file__);[ print(k,chr(61),v) for k,v in os.environ.items() ]'"
-        )
-        rc = extrun(cmd)
-        return rc
+        cont = json.dumps(inputs, sort_keys=True)
+        return hashlib.sha256(cont.encode()).hexdigest()
 
+    def unchanged(self, step, fp):
+        if self.force:
+            return False
+        return self.steps.get(step, {}).get("fp") == fp
 
-@trprint
-def clone(args_):
-    no_rest_or_die(args_)
+    def duration(self, step):
+        return self.steps.get(step, {}).get("duration")
 
-    src = os.path.abspath(__file__)
-    fnam = os.path.basename(__file__)
-    dest = os.path.join(os.getcwd(), fnam)
-    if dest == src:
-        eprint("same base folder", file=sys.stderr)
-        return 1
-    rc = shutil.copy2(src, dest)
-    return rc
+    def record(self, step, fp, duration):
+        self.steps[step] = {"fp": fp, "duration": duration, "time": time.time()}
+        self.save()
 
+    def restored(self, step, fp):
+        """a step done in the venv from the cache"""
+        self.reused.append(step)
+        if self.steps.get(step, {}).get("fp") != fp:
+            self.steps[step] = {**self.steps.get(step, {}), "fp": fp}
+            self.save()
 
-def report(*args):
-    print("ERROR", args, file=sys.stderr)
 
+def xvenv_dir():
+    return os.path.join(VENV, ".xvenv")
 
-@trprint
-def drop(args_):
-    no_rest_or_die(args_)
 
-    cwd = os.getcwd()
-    fnam = os.path.abspath(os.path.join(cwd, VENV))
-    if os.path.exists(fnam):
+def site_packages_dirs(venv=None):
+    import glob
+
+    venv = VENV if venv is None else venv
+    return sorted(glob.glob(os.path.join(venv, "lib", "python*", "site-packages")))
+
+
+def installed_version(package, venv=None):
+    import glob
+
+    for sp in site_packages_dirs(venv):
+        for fnam in glob.glob(os.path.join(sp, f"{package}-*.dist-info")):
+            return os.path.basename(fnam)[len(package) + 1 : -len(".dist-info")]
+
+
+def tree_fingerprint(root="."):
+    """fingerprint of the source files from path and content.
+    a touched, but unchanged file keeps the fingerprint"""
+    import hashlib
+
+    h = hashlib.sha256()
+    for fnam in source_files(root):
+        h.update(f"{fnam}\0".encode())
+        try:
+            file_digest(os.path.join(root, fnam), h)
+        except OSError:
+            # removed, or a broken symlink
+            h.update(b"-")
+    return h.hexdigest()
+
+
+def req_fingerprint(fnam="requirements.txt"):
+    if fnam and os.path.exists(fnam):
+        return file_digest(fnam).hexdigest()
+
+
+@trprint
+def make_step(manifest, name, func, args_, fp, volatile=False, restored=False):
+    """run a make step, unless the inputs are unchanged since the last run.
+    restored steps are done in the venv taken from the cache"""
+    if restored:
+        dprint("restored step", name)
+        manifest.restored(name, fp)
+        return
+    if not volatile and manifest.unchanged(name, fp):
+        dprint("reuse step", name)
+        manifest.reused.append(name)
+        return
+    start = time.time()
+    with StepLog(name) as log:
+        rc = func(args_)
+        if rc:
+            log.print_tail()
+    or_die_with_mesg(rc, f"{name} failed")
+    manifest.record(name, fp, time.time() - start)
+    return True
+
+
+def deps_report(manifest):
+    """the duration of the single pip run, compared with the last
+    separate tools and req steps if recorded"""
+    took = manifest.duration("deps")
+    separate = [manifest.duration("tools"), manifest.duration("req")]
+    if None in separate:
+        print(f"deps took {took:.1f}s")
+        return
+    separate = sum(separate)
+    print(
+        f"deps took {took:.1f}s, separate tools and req took {separate:.1f}s,",
+        f"saved {separate - took:.1f}s",
+    )
+
+
+def make_env(manifest, args_, fp, restored=False):
+    """the venv steps, chained from the setup fingerprint.
+    returns the fingerprint of the last step"""
+    make_step(
+        manifest, "setup", setup, args_, fp, volatile=args_.clear, restored=restored
+    )
+    fp = StepManifest.fingerprint("pip", fp)
+    make_step(manifest, "pip", pip, args_, fp, restored=restored)
+    if args_.separate or args_.remove_tool:
+        fp = StepManifest.fingerprint(
+            "tools",
+            fp,
+            installed_version("pip"),
+            sorted(args_.tool),
+            args_.remove_tool,
+        )
+        volatile = args_.update_deps
+        make_step(manifest, "tools", tools, args_, fp, volatile, restored)
+        fp = StepManifest.fingerprint(
+            "req",
+            fp,
+            installed_version("pip"),
+            req_fingerprint(),
+            args_.no_req_update,
+        )
+        make_step(manifest, "req", req, args_, fp, args_.update_req, restored)
+    else:
+        fp = StepManifest.fingerprint(
+            "deps",
+            fp,
+            installed_version("pip"),
+            sorted(args_.tool),
+            req_fingerprint(),
+            req_fingerprint(constraints_file(args_)),
+            args_.no_req_update,
+        )
+        volatile = args_.update_deps or args_.update_req
+        if make_step(manifest, "deps", deps, args_, fp, volatile, restored):
+            deps_report(manifest)
+    return fp
+
+
+@trprint
+def make(args_):
+    import shutil
+
+    no_rest_or_die(args_)
+
+    print("making...")
+
+    os.chdir(cwd)
+    manifest = StepManifest(os.path.join(xvenv_dir(), "manifest.json"), args_.force)
+    if args_.clear:
+        manifest.clear()
+
+    python = shutil.which(args_.python) or args_.python
+    fp = StepManifest.fingerprint(
+        "setup", python, interpreter_info(args_.python), args_.copy
+    )
+
+    # only a venv created by this run is stored, without the project installed
+    created = args_.clear or not os.path.exists(VENV)
+    restored = args_.cache and cache_restore(args_)
+    fp = make_env(manifest, args_, fp, restored)
+    if args_.cache and created and not restored:
+        cache_store(args_)
+
+    if not args.quick:
+        make_step(manifest, "test", test, args_, StepManifest.fingerprint("test", fp))
+        fp = StepManifest.fingerprint(
+            "build",
+            fp,
+            tree_fingerprint(),
+            args_.build_clean,
+            args_.build_clean_only,
+        )
+        make_step(manifest, "build", build, args_, fp)
+        make_step(manifest, "install", install, args_, fp)
+
+    if args_.compile:
+        fp = StepManifest.fingerprint(
+            "compile",
+            fp,
+            tree_fingerprint(),
+            args_.opt,
+            args_.invalidation_mode,
+        )
+        make_step(manifest, "compile", precompile, args_, fp)
+
+    if len(manifest.reused) > 0:
+        print("reused steps:", ", ".join(manifest.reused))
+
+
+@trprint
+def run(args_):
+
+    with VerboseOn():
+        if args_.tasks is not None:
+            no_rest_or_die(args_)
+            return run_tasks(args_)
+        if len(args_.rest) == 0:
+            eprint("what? no command given, use --help")
+            return 2
+        if args_.forkserver and not use_shell:
+            return forkserver_run(args_.rest, args_.preload or [], args_.idle)
+        rc = venvrun(args_.rest, passthru=True)
+        return rc
+
+
+SHELL_CHARS = "|&;<>()$`*?~"
+
+
+def read_tasks(fnam):
+    """cmd-lines from file, or stdin for '-'. without empty lines and comments"""
+    if fnam == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(fnam) as f:
+            lines = f.read().splitlines()
+    lines = map(lambda x: x.strip(), lines)
+    return list(filter(lambda x: len(x) > 0 and x[0] != "#", lines))
+
+
+def task_spec(line):
+    """aproc kwargs for a cmd-line, with sh only if it uses shell syntax"""
+    if any(map(lambda x: x in SHELL_CHARS, line)):
+        return venv_spec(["/bin/sh", "-c", line])
+    return venv_spec(line)
+
+
+async def run_tasks_async(specs, jobs, keep_going):
+    """run the specs with at most jobs in parallel. unless keep_going,
+    the running ones are stopped and no further started after a failure.
+    returns a list of ProcResult, False for the stopped, None for the ones not run"""
+    import asyncio
+
+    sem = asyncio.Semaphore(max(1, jobs))
+    results = [None] * len(specs)
+    failed = asyncio.Event()
+
+    async def one(i, spec):
+        async with sem:
+            if failed.is_set() and not keep_going:
+                return
+            try:
+                res = await aproc(**spec)
+            except asyncio.CancelledError:
+                results[i] = False
+                raise
+            results[i] = res
+            if res.returncode != 0:
+                failed.set()
+
+    tasks = [asyncio.ensure_future(one(i, spec)) for i, spec in enumerate(specs)]
+    if keep_going:
+        await asyncio.gather(*tasks)
+        return results
+
+    stop = asyncio.ensure_future(failed.wait())
+    pending = set(tasks)
+    while len(pending) > 0 and not failed.is_set():
+        done, pending = await asyncio.wait(
+            pending | {stop}, return_when=asyncio.FIRST_COMPLETED
+        )
+        pending.discard(stop)
+    stop.cancel()
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    return results
+
+
+@trprint
+def run_tasks(args_):
+    """run each cmd-line of the tasks file as process within the venv"""
+    import asyncio
+
+    lines = read_tasks(args_.tasks)
+    jobs = args_.jobs if args_.jobs > 0 else os.cpu_count()
+    capture = args_.capture
+
+    specs = []
+    temps = []
+    for i, line in enumerate(lines):
+        spec = task_spec(line)
+        if type(spec) == int:
+            eprint("task", i, line)
+            return spec
+        temps.append(spec.pop("temp", None))
+        spec.update({"timeout": timeout_, "prefix": f"task.{i}", "quiet": capture})
+        specs.append(spec)
+
+    print("run", len(lines), "tasks", "jobs", jobs)
+    try:
+        results = asyncio.run(run_tasks_async(specs, jobs, args_.keep_going))
+    finally:
+        for temp in filter(lambda x: x is not None, temps):
+            remove_temp(temp)
+
+    rows = []
+    for i, (line, res) in enumerate(zip(lines, results)):
+        if not res:
+            rows.append([i, "-", "not run" if res is None else "stopped", line])
+            continue
+        if capture:
+            print(f"[task.{i}]", line, "rc", res.returncode)
+            sys.stdout.flush()
+            for buf, stream in [(res.stdout, sys.stdout), (res.stderr, sys.stderr)]:
+                stream = stream.buffer if hasattr(stream, "buffer") else stream
+                stream.write(buf)
+                stream.flush()
+        rows.append([i, res.returncode, f"{res.duration:.1f}s", line])
+
+    print()
+    print_table(["task", "rc", "duration", "cmd"], rows)
+    failed = len([r for r in results if r and r.returncode != 0])
+    skipped = len([r for r in results if not r])
+    print("tasks", len(lines), "failed", failed, "stopped or not run", skipped)
+    if failed > 0 or skipped > 0:
+        return 1
+
+
+def self_call_code(func, *args_):
+    """python code for calling a function of this module in another interpreter"""
+    modpath = os.path.dirname(os.path.abspath(__file__))
+    modname = os.path.splitext(os.path.basename(__file__))[0]
+    return "; ".join(
+        [
+            "import sys",
+            f"sys.path.insert(0, {modpath!r})",
+            f"import {modname} as xv",
+            "sys.path.pop(0)",
+            f"xv.{func}(" + ", ".join(map(repr, args_)) + ")",
+        ]
+    )
+
+
+#
+# fork server
+#
+# a long running interpreter within the venv with preloaded modules.
+# each 'run --forkserver python ...' forks a child from it,
+# instead of starting a new interpreter.
+#
+
+FORKSERVER_IDLE = 600
+
+
+def forkserver_stamp(venv, preload):
+    """changes when packages are installed or removed in the venv"""
+    stamp = [os.path.join(venv, "bin", "python"), sorted(preload)]
+    for sp in site_packages_dirs(venv):
+        stamp.append([sp, os.stat(sp).st_mtime_ns])
+    return StepManifest.fingerprint(*stamp)
+
+
+def forkserver_exec(argv):
+    """run a python cmd-line in the current interpreter, returns the exit code"""
+    import runpy
+    import traceback
+
+    opts = argv[1:]
+    try:
+        if len(opts) == 0:
+            raise SystemExit("no script given")
+        if opts[0] == "-m":
+            sys.argv = [opts[1], *opts[2:]]
+            runpy.run_module(opts[1], run_name="__main__", alter_sys=True)
+        elif opts[0] == "-c":
+            sys.argv = ["-c", *opts[2:]]
+            exec(compile(opts[1], "<string>", "exec"), {"__name__": "__main__"})
+        else:
+            sys.argv = list(opts)
+            sys.path[0] = os.path.dirname(os.path.abspath(opts[0]))
+            runpy.run_path(opts[0], run_name="__main__")
+        rc = 0
+    except SystemExit as ex:
+        rc = ex.code
+        if rc is None:
+            rc = 0
+        elif isinstance(rc, bool):
+            # unittest.main exits with a bool
+            rc = int(rc)
+        elif type(rc) != int:
+            print(rc, file=sys.stderr)
+            rc = 1
+    except BaseException:
+        traceback.print_exc()
+        rc = 1
+    for f in [sys.stdout, sys.stderr]:
+        try:
+            f.flush()
+        except Exception:
+            pass
+    return rc
+
+
+def forkserver_handle(conn, req, fds):
+    """runs in a forked handler process. never returns"""
+    import json
+    import socket
+
+    try:
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            for no, fd in enumerate(fds):
+                os.dup2(fd, no)
+                os.close(fd)
+            sys.stdin = os.fdopen(0, "r", closefd=False)
+            for no, name in [(1, "stdout"), (2, "stderr")]:
+                buffering = 1 if os.isatty(no) else -1
+                setattr(sys, name, os.fdopen(no, "w", buffering, closefd=False))
+            os.chdir(req["cwd"])
+            os.environ.clear()
+            os.environ.update(req["env"])
+            os._exit(forkserver_exec(req["argv"]))
+
+        for fd in fds:
+            os.close(fd)
+        conn.sendall((json.dumps({"pid": pid}) + "\n").encode())
+        _, status = os.waitpid(pid, 0)
+        rc = os.waitstatus_to_exitcode(status)
+        conn.sendall((json.dumps({"rc": rc}) + "\n").encode())
+        conn.shutdown(socket.SHUT_RDWR)
+    finally:
+        os._exit(0)
+
+
+def forkserver_fork(srv, conn, stamp):
+    """forks the handler process for the request on conn.
+    returns the pid, or None if the server is stale"""
+    import json
+    import socket
+
+    msg, fds, _, _ = socket.recv_fds(conn, 1024 * 1024, 3)
+    try:
+        req = json.loads(msg.decode())
+        if req["stamp"] != stamp:
+            conn.sendall((json.dumps({"stale": True}) + "\n").encode())
+            return
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            srv.close()
+            forkserver_handle(conn, req, fds)
+        return pid
+    finally:
+        conn.close()
+        for fd in fds:
+            os.close(fd)
+
+
+def forkserver_reap(children):
+    for pid in list(children):
+        if os.waitpid(pid, os.WNOHANG)[0] != 0:
+            children.remove(pid)
+
+
+def forkserver_loop(srv, stamp, idle):
+    """accepts the requests until idle or stale"""
+    import socket
+
+    children = set()
+    last = time.time()
+    while True:
+        forkserver_reap(children)
+        try:
+            conn, _ = srv.accept()
+        except socket.timeout:
+            if len(children) == 0 and time.time() - last > idle:
+                print("forkserver idle shutdown", flush=True)
+                return
+            continue
+        last = time.time()
+        conn.settimeout(None)
+        pid = forkserver_fork(srv, conn, stamp)
+        if pid is None:
+            print("forkserver stale, shutdown", flush=True)
+            return
+        children.add(pid)
+
+
+def forkserver_main(sock_path, stamp, idle, preload):
+    """server loop, runs within the venv interpreter"""
+    import importlib
+    import socket
+
+    for mod in preload:
+        try:
+            importlib.import_module(mod)
+        except Exception as ex:
+            eprint("preload failed", mod, ex)
+
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(sock_path):
+        os.remove(sock_path)
+    srv.bind(sock_path)
+    ino = os.stat(sock_path).st_ino
+    srv.listen(64)
+    srv.settimeout(1)
+
+    print("forkserver started", os.getpid(), preload, flush=True)
+
+    try:
+        forkserver_loop(srv, stamp, idle)
+    finally:
+        srv.close()
+        # a restarted server might already listen on a new socket
+        try:
+            if os.stat(sock_path).st_ino == ino:
+                os.remove(sock_path)
+        except OSError:
+            pass
+
+
+@trprint
+def forkserver_start(venv, sock_path, stamp, idle, preload):
+    import subprocess
+
+    code = self_call_code("forkserver_main", sock_path, stamp, idle, preload)
+    log = open(os.path.join(os.path.dirname(sock_path), "forkserver.log"), "a")
+    vprint("starting forkserver", venv)
+    env, _ = venv_env()
+    subprocess.Popen(
+        [os.path.join(venv, "bin", "python"), "-c", code],
+        stdin=subprocess.DEVNULL,
+        stdout=log,
+        stderr=log,
+        env=env,
+        start_new_session=True,
+    )
+    log.close()
+
+
+@trprint
+def forkserver_connect(venv, preload, idle, stamp):
+    import socket
+    import fcntl
+
+    xvdir = os.path.join(venv, ".xvenv")
+    os.makedirs(xvdir, exist_ok=True)
+    sock_path = os.path.join(xvdir, "forkserver.sock")
+
+    def connect():
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(sock_path)
+            return conn
+        except OSError:
+            conn.close()
+
+    conn = connect()
+    if conn is not None:
+        return conn
+
+    with open(os.path.join(xvdir, "forkserver.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        conn = connect()
+        if conn is None:
+            forkserver_start(venv, sock_path, stamp, idle, preload)
+            start = time.time()
+            while conn is None and time.time() - start < 60:
+                time.sleep(0.01)
+                conn = connect()
+    return conn
+
+
+def forkserver_request(conn, req):
+    """sends the request with stdin, stdout, and stderr. returns the last reply"""
+    import json
+    import signal
+    import socket
+
+    reply = {}
+    pid = None
+    try:
+        with conn:
+            socket.send_fds(conn, [json.dumps(req).encode()], [0, 1, 2])
+            with conn.makefile("r") as f:
+                for line in f:
+                    reply = json.loads(line)
+                    pid = reply.get("pid", pid)
+    except KeyboardInterrupt:
+        if pid is not None:
+            os.kill(pid, signal.SIGINT)
+        return {"rc": 130}
+    except (ConnectionResetError, BrokenPipeError):
+        # queued at a server shutting down
+        if pid is None:
+            return {"stale": True}
+    return reply
+
+
+@trprint
+def forkserver_run(argv, preload, idle=FORKSERVER_IDLE):
+    import re
+
+    supported = (
+        len(argv) > 1
+        and re.match(r"^python[\d.]*$", os.path.basename(argv[0]))
+        and (argv[1] in ["-m", "-c"] or not argv[1].startswith("-"))
+    )
+    if not supported:
+        vprint("not a supported python cmd-line, forkserver not used")
+        return venvrun(argv, passthru=True)
+
+    env, workdir = venv_env()
+    venv = env["VIRTUAL_ENV"]
+    if not os.path.isdir(os.path.join(venv, "bin")):
+        eprint("venv not found", venv)
+        return 1
+
+    stamp = forkserver_stamp(venv, preload)
+    req = {"argv": argv, "cwd": workdir, "env": env, "stamp": stamp}
+
+    for attempt in range(3):
+        conn = forkserver_connect(venv, preload, idle, stamp)
+        if conn is None:
+            eprint("forkserver not available")
+            return 1
+
+        reply = forkserver_request(conn, req)
+        if reply.get("stale"):
+            vprint("forkserver stale, restarting")
+            continue
+        if "rc" not in reply:
+            eprint("forkserver failed")
+            return 1
+        return reply["rc"] if reply["rc"] else None
+
+    eprint("forkserver not available")
+    return 1
+
+
+@trprint
+def test(args_):
+    no_rest_or_die(args_)
+
+    with VerboseOn():
+        rc = venvrun(
+            f"{args_.python} -c 'import os; import pip; print(pip.__file__);[ print(k,chr(61),v) for k,v in os.environ.items() ]'"
+        )
+        return rc
+
+
+@trprint
+def clone(args_):
+    import shutil
+
+    no_rest_or_die(args_)
+
+    src = os.path.abspath(__file__)
+    fnam = os.path.basename(__file__)
+    dest = os.path.join(os.getcwd(), fnam)
+    if dest == src:
+        eprint("same base folder", file=sys.stderr)
+        return 1
+    rc = shutil.copy2(src, dest)
+    return rc
+
+
+@trprint
+def clone_venv(args_):
+    """copy the venv to another folder, and rewrite the absolute paths"""
+    no_rest_or_die(args_)
+
+    src = os.path.abspath(VENV)
+    dest = os.path.abspath(args_.dest)
+    if not os.path.isdir(src):
+        eprint("venv not found", src)
+        return 1
+    if os.path.exists(dest):
+        eprint("destination exists", dest)
+        return 1
+
+    start = time.time()
+    engine = copy_venv_tree(src, dest, hardlink=not args_.no_hardlink, skip=[".xvenv"])
+    fixup_venv_paths(dest, src, dest)
+    print("cloned", dest, f"{time.time() - start:.2f}s", engine.summary())
+
+
+def report(*args):
+    print("ERROR", args, file=sys.stderr)
+
+
+@trprint
+def logs(args_):
+    """replay the log of a step, or list the logs"""
+    import gzip
+    import shutil
+
+    no_rest_or_die(args_)
+
+    folder = os.path.join(xvenv_dir(), "logs")
+    if args_.step is None:
+        if not os.path.isdir(folder):
+            return
+        for fnam in sorted(os.listdir(folder)):
+            st = os.stat(os.path.join(folder, fnam))
+            print(
+                f"{fnam[: -len('.log.gz')]:20}",
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(st.st_mtime)),
+                f"{st.st_size / 1024:8.1f} kB",
+            )
+        return
+
+    fnam = os.path.join(folder, f"{args_.step}.log.gz")
+    if not os.path.exists(fnam):
+        eprint("no log for", args_.step)
+        return 1
+    out = sys.stdout.buffer if hasattr(sys.stdout, "buffer") else sys.stdout
+    with gzip.open(fnam, "rb") as f:
+        shutil.copyfileobj(f, out)
+    out.flush()
+
+
+@trprint
+def drop(args_):
+    no_rest_or_die(args_)
+
+    cwd = os.getcwd()
+    fnam = os.path.abspath(os.path.join(cwd, VENV))
+    if os.path.exists(fnam):
         if os.path.isdir(fnam):
             rc = input(f"really drop {fnam} ? (y)es/(N)o : ")
             rc = rc.strip().lower()
             if rc in ["y", "yes"]:
                 print("removing...")
-                shutil.rmtree(fnam, ignore_errors=False, onerror=report)
+                reap(trash(fnam), wait=args_.wait)
             else:
                 print("aborted")
         else:
@@ -435,50 +2295,1655 @@ def drop(args_):
         return 1
 
 
+#
+# trash
+#
+# folders are renamed into the trash folder on the same filesystem,
+# and removed by a detached reaper process in background.
+#
+
+TRASH = ".xvenv-trash"
+
+
+def ignore_trash(trash_dir):
+    """the trash folder is ignored by git, and by black and other tools
+    reading .gitignore"""
+    ignore = os.path.join(trash_dir, ".gitignore")
+    if not os.path.exists(ignore):
+        with open(ignore, "w") as f:
+            f.write("*\n")
+
+
+@trprint
+def trash(fnam, trash_dir=None):
+    """moves fnam into the trash folder, next to it if not given.
+    returns the trash folder"""
+    fnam = os.path.abspath(fnam)
+    if trash_dir is None:
+        trash_dir = os.path.join(os.path.dirname(fnam), TRASH)
+    os.makedirs(trash_dir, exist_ok=True)
+    ignore_trash(trash_dir)
+    dest = os.path.join(
+        trash_dir, f"{os.path.basename(fnam)}-{os.getpid()}-{time.time_ns()}"
+    )
+    os.rename(fnam, dest)
+    return trash_dir
+
+
+def unlink_files(path):
+    """unlinks the files of a folder, returns the sub folders"""
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+                except OSError as ex:
+                    report(entry.path, ex)
+    except OSError as ex:
+        report(path, ex)
+    return subdirs
+
+
+def remove_dirs(dirs):
+    # parents are always listed before their sub folders
+    for path in reversed(dirs):
+        try:
+            os.rmdir(path)
+        except OSError as ex:
+            report(path, ex)
+
+
+def remove_tree(top, jobs=None):
+    """parallel removal of a folder tree. files are unlinked by a thread pool,
+    the folders are removed afterwards bottom up"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not os.path.isdir(top) or os.path.islink(top):
+        os.remove(top)
+        return
+
+    jobs = jobs if jobs else min(32, (os.cpu_count() or 1) * 4)
+    dirs = [top]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = [pool.submit(unlink_files, top)]
+        while len(pending) > 0:
+            for subdir in pending.pop().result():
+                dirs.append(subdir)
+                pending.append(pool.submit(unlink_files, subdir))
+    remove_dirs(dirs)
+
+
+def reap_trash(trash_dir):
+    for fnam in os.listdir(trash_dir):
+        if fnam != ".gitignore":
+            remove_tree(os.path.join(trash_dir, fnam))
+    try:
+        os.remove(os.path.join(trash_dir, ".gitignore"))
+    except FileNotFoundError:
+        pass
+    try:
+        os.rmdir(trash_dir)
+    except OSError:
+        # another xvenv moved something in meanwhile
+        ignore_trash(trash_dir)
+
+
+@trprint
+def reap(trash_dir, wait=False):
+    """empty the trash folder. in background unless wait"""
+    import subprocess
+
+    if wait:
+        reap_trash(trash_dir)
+        return
+
+    subprocess.Popen(
+        [sys.executable, "-c", self_call_code("reap_trash", trash_dir)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+#
+# venv cache
+#
+# cache entries are stored in folder 'venvs' below the cache folder.
+# each entry is keyed by the interpreter, the tools list, and the
+# content of requirements.txt, and holds a copy of the venv after
+# the steps setup, pip, tools, and req.
+#
+
+
+def cache_venvs_dir():
+    return os.path.join(cache_dir_, "venvs")
+
+
+def interpreter_info(python):
+    import subprocess
+
+    try:
+        rc = subprocess.run(
+            [
+                python,
+                "-c",
+                "import sys, sysconfig; print(sys.version); print(sys.platform); print(sysconfig.get_config_var('SOABI'))",
+            ],
+            capture_output=True,
+        )
+    except OSError:
+        return
+    if rc.returncode:
+        return None
+    return rc.stdout.decode().strip()
+
+
+def file_digest(fnam, h=None):
+    import hashlib
+
+    h = hashlib.sha256() if h is None else h
+    with open(fnam, "rb") as f:
+        while True:
+            buf = f.read(1024 * 1024)
+            if len(buf) == 0:
+                break
+            h.update(buf)
+    return h
+
+
+@trprint
+def cache_key(args_):
+    import hashlib
+
+    info = interpreter_info(args_.python)
+    if info is None:
+        return
+    h = hashlib.sha256()
+    h.update(info.encode())
+    h.update(b"\0")
+    h.update(" ".join(sorted(getattr(args_, "tool", tools_))).encode())
+    h.update(b"\0")
+    if os.path.exists("requirements.txt"):
+        file_digest("requirements.txt", h)
+    constraint = constraints_file(args_)
+    if constraint and os.path.exists(constraint):
+        h.update(b"\0")
+        file_digest(constraint, h)
+    # a venv with copies of the interpreter, or with symlinks
+    h.update(f"\0copy={getattr(args_, 'copy', False)}".encode())
+    return h.hexdigest()
+
+
+def dir_size(fnam):
+    total = 0
+    for root, dirs, files in os.walk(fnam):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+
+#
+# copy engine
+#
+# files are cloned with FICLONE reflinks where the file system supports it
+# (btrfs, xfs), hardlinked if read-only content in site-packages, copied
+# in kernel with copy_file_range, or copied as last resort.
+#
+
+FICLONE = 0x40049409
+
+# not changed in place by pip, only replaced or removed
+HARDLINK_SUFFIXES = (".py", ".pyc", ".pyi", ".so")
+
+
+class CopyEngine(object):
+    def __init__(self, hardlink=False):
+        import threading
+
+        self.hardlink = hardlink
+        # disabled after the first failure
+        self.reflink = sys.platform.startswith("linux")
+        self.copy_range = hasattr(os, "copy_file_range")
+        self.stats = {"reflink": 0, "hardlink": 0, "copy_range": 0, "copy": 0}
+        # copy is called from the threads of copy_tree
+        self.lock = threading.Lock()
+
+    def count(self, method):
+        with self.lock:
+            self.stats[method] += 1
+
+    def linkable(self, src):
+        return (
+            self.hardlink
+            and src.endswith(HARDLINK_SUFFIXES)
+            and f"{os.sep}site-packages{os.sep}" in src
+        )
+
+    def clone(self, src, dest):
+        import fcntl
+
+        with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+            fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+
+    def copy_file_range(self, src, dest):
+        with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+            size = os.fstat(fsrc.fileno()).st_size
+            while size > 0:
+                n = os.copy_file_range(fsrc.fileno(), fdest.fileno(), size)
+                if n == 0:
+                    break
+                size -= n
+
+    def copy(self, src, dest):
+        """copy a regular file with mode and times. usable as copy_function"""
+        import shutil
+
+        if self.reflink:
+            try:
+                self.clone(src, dest)
+                shutil.copystat(src, dest)
+                self.count("reflink")
+                return dest
+            except OSError:
+                self.reflink = False
+                os.remove(dest)
+        if self.linkable(src):
+            try:
+                os.link(src, dest)
+                self.count("hardlink")
+                return dest
+            except OSError:
+                self.hardlink = False
+        if self.copy_range:
+            try:
+                self.copy_file_range(src, dest)
+                shutil.copystat(src, dest)
+                self.count("copy_range")
+                return dest
+            except OSError:
+                self.copy_range = False
+        shutil.copy2(src, dest)
+        self.count("copy")
+        return dest
+
+    def summary(self):
+        return ", ".join(f"{k} {v}" for k, v in self.stats.items() if v > 0)
+
+
+def copy_tree(src, dest, engine=None, skip=None, jobs=None):
+    """parallel copy of a folder tree, symlinks are copied as symlinks.
+    folders in skip, as path relative to src, and sockets and other
+    special files are left out"""
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+
+    engine = CopyEngine() if engine is None else engine
+    skip = set(os.path.normpath(p) for p in skip or [])
+    jobs = jobs if jobs else min(32, (os.cpu_count() or 1) * 4)
+
+    dirs = []
+    futures = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = [(src, dest, "")]
+        while len(pending) > 0:
+            s, d, rel = pending.pop()
+            os.makedirs(d)
+            dirs.append((s, d))
+            with os.scandir(s) as it:
+                for entry in it:
+                    target = os.path.join(d, entry.name)
+                    if entry.is_symlink():
+                        os.symlink(os.readlink(entry.path), target)
+                    elif entry.is_dir():
+                        sub = os.path.join(rel, entry.name)
+                        if sub not in skip:
+                            pending.append((entry.path, target, sub))
+                    elif entry.is_file():
+                        futures.append(pool.submit(engine.copy, entry.path, target))
+        for f in futures:
+            f.result()
+
+    # after the files, since this changes the mtime of the folders
+    for s, d in reversed(dirs):
+        shutil.copystat(s, d)
+    return engine
+
+
+def copy_venv_tree(src, dest, hardlink=False, skip=None):
+    return copy_tree(src, dest, CopyEngine(hardlink), skip=skip)
+
+
+def copy_interpreter(venv, engine=None):
+    """replace the symlinks to the interpreter in bin with copies"""
+    engine = CopyEngine() if engine is None else engine
+    venv = os.path.abspath(venv)
+    bin_dir = os.path.join(venv, "bin")
+    for fnam in sorted(os.listdir(bin_dir)):
+        path = os.path.join(bin_dir, fnam)
+        if not os.path.islink(path):
+            continue
+        target = os.path.realpath(path)
+        if target.startswith(venv + os.sep) or not os.path.isfile(target):
+            continue
+        dprint("copy", target, path)
+        os.remove(path)
+        engine.copy(target, path)
+    return engine
+
+
+def fixup_venv_paths(venv, old_path, new_path):
+    """replace absolute venv paths in scripts and pyvenv.cfg"""
+    old_path = old_path.encode()
+    new_path = new_path.encode()
+    bin_dir = os.path.join(venv, "bin")
+    fnams = [os.path.join(venv, "pyvenv.cfg")]
+    if os.path.isdir(bin_dir):
+        fnams.extend([os.path.join(bin_dir, f) for f in os.listdir(bin_dir)])
+    for fnam in fnams:
+        if os.path.islink(fnam) or not os.path.isfile(fnam):
+            continue
+        with open(fnam, "rb") as f:
+            cont = f.read()
+        if cont.find(old_path) < 0:
+            continue
+        dprint("fixup", fnam)
+        mode = os.stat(fnam).st_mode
+        # unlink first, the file might be a hardlink into the cache
+        os.remove(fnam)
+        with open(fnam, "wb") as f:
+            f.write(cont.replace(old_path, new_path))
+        os.chmod(fnam, mode)
+
+
+def cache_load_meta(entry):
+    import json
+
+    try:
+        with open(os.path.join(entry, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def cache_save_meta(entry, meta):
+    import json
+
+    with open(os.path.join(entry, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=4)
+
+
+def cache_entries():
+    entries = []
+    for base in [cache_venvs_dir(), cache_builds_dir()]:
+        if not os.path.isdir(base):
+            continue
+        for key in os.listdir(base):
+            entry = os.path.join(base, key)
+            meta = cache_load_meta(entry)
+            if meta is None:
+                continue
+            entries.append((entry, meta))
+    return entries
+
+
+@trprint
+def cache_restore(args_):
+    """materialize the venv from the cache. returns True on a cache hit"""
+    if args_.clear is False and os.path.exists(VENV):
+        vprint("venv exists, cache not used")
+        return False
+    if getattr(args_, "update_deps", False) or getattr(args_, "update_req", False):
+        vprint("update requested, cache not used")
+        return False
+
+    key = cache_key(args_)
+    if key is None:
+        return False
+    entry = os.path.join(cache_venvs_dir(), key)
+    meta = cache_load_meta(entry)
+    if meta is None:
+        vprint("cache miss", key)
+        return False
+
+    print("cache hit", key)
+    dest = os.path.abspath(VENV)
+    if os.path.exists(dest):
+        reap(trash(dest), wait=getattr(args_, "wait", False))
+    engine = copy_venv_tree(os.path.join(entry, "venv"), dest, hardlink=True)
+    vprint("restored", engine.summary())
+    fixup_venv_paths(dest, meta["origin"], dest)
+
+    meta["used"] = time.time()
+    cache_save_meta(entry, meta)
+    return True
+
+
+@trprint
+def cache_store(args_):
+    import shutil
+
+    key = cache_key(args_)
+    if key is None:
+        return
+    base = cache_venvs_dir()
+    entry = os.path.join(base, key)
+    if os.path.exists(entry):
+        return
+
+    src = os.path.abspath(VENV)
+    tmp = f"{entry}.tmp-{os.getpid()}"
+    vprint("cache store", key)
+    try:
+        os.makedirs(tmp)
+        # without the logs, manifest, check caches, and build venv
+        copy_venv_tree(src, os.path.join(tmp, "venv"), skip=[".xvenv"])
+        now = time.time()
+        meta = {
+            "key": key,
+            "python": args_.python,
+            "tools": getattr(args_, "tool", tools_),
+            "origin": src,
+            "size": dir_size(tmp),
+            "created": now,
+            "used": now,
+        }
+        cache_save_meta(tmp, meta)
+        os.rename(tmp, entry)
+    except OSError as ex:
+        eprint("cache store failed", ex)
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+
+    cache_evict(cache_size_ * 1024 * 1024)
+
+
+@trprint
+def cache_evict(max_size):
+    """remove least recently used entries until below max_size bytes"""
+    import shutil
+
+    entries = sorted(cache_entries(), key=lambda x: x[1]["used"])
+    total = sum(map(lambda x: x[1]["size"], entries))
+    for entry, meta in entries:
+        if total <= max_size:
+            break
+        vprint("cache evict", meta["key"])
+        shutil.rmtree(entry, ignore_errors=False, onerror=report)
+        total -= meta["size"]
+    return total
+
+
+@trprint
+def cache(args_):
+    no_rest_or_die(args_)
+
+    if args_.action == "prune":
+        max_size = 0 if args_.all else args_.max_size * 1024 * 1024
+        total = cache_evict(max_size)
+        print("cache size", f"{total / (1024 * 1024):.1f} MB")
+        return
+
+    total = 0
+    for entry, meta in sorted(cache_entries(), key=lambda x: -x[1]["used"]):
+        total += meta["size"]
+        used = time.strftime("%Y-%m-%d %H:%M", time.localtime(meta["used"]))
+        print(
+            meta["key"][:12],
+            f"{meta['size'] / (1024 * 1024):8.1f} MB",
+            used,
+            f"{meta.get('kind', 'venv'):5}",
+            meta["python"],
+            " ".join(meta["tools"] if "files" not in meta else meta["files"]),
+        )
+    print("cache size", f"{total / (1024 * 1024):.1f} MB", "in", cache_dir_)
+
+
+#
+# build cache
+#
+# the artifacts in 'dist' are stored in folder 'builds' below the cache
+# folder. each entry is keyed by the content of the source files, the
+# project settings, the interpreter, and the build tools in the venv.
+#
+
+BUILD_INPUTS = [
+    "setup.py",
+    "setup.json",
+    "setup.cfg",
+    "MANIFEST.in",
+    "requirements.txt",
+]
+
+
+def cache_builds_dir():
+    return os.path.join(cache_dir_, "builds")
+
+
+def source_date_epoch():
+    """time of the last commit, for reproducible builds"""
+    import subprocess
+
+    try:
+        rc = subprocess.run(
+            ["git", "log", "-1", "--format=%ct"], capture_output=True, text=True
+        )
+        if rc.returncode == 0 and rc.stdout.strip():
+            return rc.stdout.strip()
+    except OSError:
+        pass
+    # earliest time stamp allowed in zip files
+    return "315532800"
+
+
+def source_skipped(fnam):
+    """in a venv, build, or cache folder"""
+    skip = set([VENV, ".git", "build", "dist", "__pycache__", ".xvenv", TRASH])
+    dirs = fnam.split("/")[:-1]
+    return any(d in skip or d.endswith(".egg-info") for d in dirs)
+
+
+def source_files(root="."):
+    """the files tracked by git, and the untracked but not ignored files.
+    all files if not in a git repo. without venv and build folders"""
+    import subprocess
+
+    try:
+        rc = subprocess.run(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            cwd=root,
+            capture_output=True,
+        )
+        if rc.returncode == 0:
+            fnams = rc.stdout.decode().split("\0")
+            fnams = filter(lambda x: len(x) > 0 and not source_skipped(x), fnams)
+            return sorted(set(fnams))
+    except OSError:
+        pass
+    fnams = []
+    for base, dirs, files in os.walk(root):
+        fnams.extend(os.path.relpath(os.path.join(base, f), root) for f in files)
+        rel = os.path.relpath(base, root)
+        dirs[:] = filter(
+            lambda x: not source_skipped(os.path.join(rel, x, "")),
+            dirs,
+        )
+    return sorted(fnams)
+
+
+@trprint
+def build_key(args_):
+    import hashlib
+
+    info = interpreter_info(args_.python)
+    if info is None:
+        return
+    h = hashlib.sha256()
+    h.update(info.encode())
+    for package in ["setuptools", "wheel"]:
+        h.update(f"\0{package}={installed_version(package)}".encode())
+    h.update(f"\0{os.environ.get('SOURCE_DATE_EPOCH')}".encode())
+    h.update(f"\0pep517={getattr(args_, 'pep517', False)}".encode())
+
+    # const.py holds the VERSION
+    const = os.path.join(os.path.basename(os.getcwd()), "const.py")
+    for fnam in sorted(set(source_files() + BUILD_INPUTS + [const])):
+        h.update(f"\0{fnam}\0".encode())
+        try:
+            file_digest(fnam, h)
+        except OSError:
+            # removed, or not existing
+            h.update(b"-")
+    return h.hexdigest()
+
+
+@trprint
+def build_restore(key):
+    """copy the cached artifacts into dist. returns True on a cache hit"""
+    import shutil
+
+    if key is None:
+        return False
+    entry = os.path.join(cache_builds_dir(), key)
+    meta = cache_load_meta(entry)
+    if meta is None:
+        vprint("build cache miss", key)
+        return False
+
+    print("build cache hit", key)
+    os.makedirs("dist", exist_ok=True)
+    for fnam in meta["files"]:
+        dprint("restore", fnam)
+        shutil.copy2(os.path.join(entry, "dist", fnam), os.path.join("dist", fnam))
+
+    meta["used"] = time.time()
+    cache_save_meta(entry, meta)
+    return True
+
+
+@trprint
+def build_store(key, args_, start):
+    """store the artifacts in dist created since start"""
+    import shutil
+
+    if not os.path.isdir("dist"):
+        return
+    files = [
+        f
+        for f in sorted(os.listdir("dist"))
+        if os.stat(os.path.join("dist", f)).st_mtime >= start - 1
+    ]
+    if len(files) == 0:
+        return
+
+    entry = os.path.join(cache_builds_dir(), key)
+    tmp = f"{entry}.tmp-{os.getpid()}"
+    vprint("build cache store", key, *files)
+    try:
+        os.makedirs(os.path.join(tmp, "dist"))
+        for fnam in files:
+            shutil.copy2(os.path.join("dist", fnam), os.path.join(tmp, "dist", fnam))
+        now = time.time()
+        meta = {
+            "key": key,
+            "kind": "build",
+            "python": args_.python,
+            "tools": [],
+            "files": files,
+            "origin": os.getcwd(),
+            "size": dir_size(tmp),
+            "created": now,
+            "used": now,
+        }
+        cache_save_meta(tmp, meta)
+        if os.path.exists(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmp, entry)
+    except OSError as ex:
+        eprint("build cache store failed", ex)
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+
+    cache_evict(cache_size_ * 1024 * 1024)
+
+
+#
+# pep 517 build
+#
+# the hooks of the build backend are called by workers running within
+# a build venv '.venv/.xvenv/buildenv'. the build venv is created once
+# with the requires of the build-system, and reused until they change.
+#
+
+BUILD_SYSTEM = {
+    "requires": ["setuptools>=40.8.0", "wheel"],
+    "build-backend": "setuptools.build_meta:__legacy__",
+}
+
+
+def build_system(fnam="pyproject.toml"):
+    """build-system table of pyproject.toml, or the setuptools defaults"""
+    if not os.path.exists(fnam):
+        return BUILD_SYSTEM
+    try:
+        import tomllib
+    except ImportError:
+        eprint("reading", fnam, "requires python 3.11, using setuptools defaults")
+        return BUILD_SYSTEM
+    with open(fnam, "rb") as f:
+        cfg = tomllib.load(f).get("build-system")
+    if cfg is None:
+        return BUILD_SYSTEM
+    return {
+        "requires": cfg.get("requires", BUILD_SYSTEM["requires"]),
+        "build-backend": cfg.get("build-backend", BUILD_SYSTEM["build-backend"]),
+        "backend-path": cfg.get("backend-path", []),
+    }
+
+
+def pep517_hook(backend, backend_path, hook, args_, result):
+    """calls a hook of the build backend, and writes the return value
+    as json to file result. runs within the build venv"""
+    import json
+    import importlib
+
+    # the source tree is not importable, except backend-path
+    cwd = os.getcwd()
+    sys.path[:] = [p for p in sys.path if p not in ["", cwd]]
+    sys.path[:0] = [os.path.join(cwd, p) for p in backend_path]
+
+    modname, _, objname = backend.partition(":")
+    obj = importlib.import_module(modname)
+    for name in filter(lambda x: len(x) > 0, objname.split(".")):
+        obj = getattr(obj, name)
+
+    func = getattr(obj, hook, None)
+    if func is None:
+        # all hooks for requires are optional
+        rc = []
+    else:
+        rc = func(*args_)
+    with open(result, "w") as f:
+        json.dump(rc, f)
+
+
+def pep517_hooks(python, cfg, calls, tmp):
+    """calls the hooks (prefix, srcdir, hook, args) in parallel workers.
+    returns the list of return values, or None on error"""
+    import json
+    import asyncio
+
+    env = dict(os.environ)
+    env.pop("PYTHONPATH", None)
+    env["VIRTUAL_ENV"] = os.path.dirname(os.path.dirname(python))
+    env["PATH"] = os.pathsep.join([os.path.dirname(python), env.get("PATH", "")])
+
+    specs = []
+    results = []
+    for i, (prefix, srcdir, hook, args_) in enumerate(calls):
+        result = os.path.join(tmp, f"{prefix}-{hook}-{i}.json")
+        code = self_call_code(
+            "pep517_hook",
+            cfg["build-backend"],
+            cfg.get("backend-path", []),
+            hook,
+            args_,
+            result,
+        )
+        specs.append(
+            {
+                "args_": [python, "-c", code],
+                "env": env,
+                "cwd": srcdir,
+                "prefix": prefix,
+                "timeout": timeout_,
+            }
+        )
+        results.append(result)
+
+    res = asyncio.run(run_many(specs, len(specs)))
+    if any(map(lambda x: x.rc, res)):
+        return
+
+    rc = []
+    for result in results:
+        with open(result) as f:
+            rc.append(json.load(f))
+    return rc
+
+
+@trprint
+def buildenv(args_, cfg):
+    """creates or reuses the build venv. returns its python, or None on error"""
+    import json
+    import hashlib
+
+    python = os.path.abspath(os.path.join(VENV, "bin", "python"))
+    info = interpreter_info(python)
+    if info is None:
+        eprint("venv not found, run setup before")
+        return
+
+    path = os.path.abspath(os.path.join(xvenv_dir(), "buildenv"))
+    stamp = os.path.join(path, "xvenv-buildenv.json")
+    h = hashlib.sha256()
+    h.update(info.encode())
+    h.update(json.dumps(sorted(cfg["requires"])).encode())
+    key = h.hexdigest()
+
+    try:
+        with open(stamp) as f:
+            if json.load(f)["key"] == key:
+                dprint("reuse buildenv", path)
+                return os.path.join(path, "bin", "python")
+    except (OSError, ValueError, KeyError):
+        pass
+
+    print("creating buildenv", *cfg["requires"])
+    if os.path.exists(path):
+        reap(trash(path), wait=False)
+    if proc([python, "-m", "venv", path]):
+        return
+    bpython = os.path.join(path, "bin", "python")
+    if buildenv_install(args_, bpython, cfg["requires"]):
+        return
+    with open(stamp, "w") as f:
+        json.dump({"key": key, "requires": cfg["requires"]}, f, indent=4)
+    return bpython
+
+
+def buildenv_install(args_, python, requires):
+    import shlex
+
+    if len(requires) == 0:
+        return
+    return proc(
+        [
+            python,
+            "-m",
+            "pip",
+            "install",
+            "-q",
+            *shlex.split(wheelhouse_opts(args_)),
+            *requires,
+        ]
+    )
+
+
+def buildenv_requires(args_, python, requires):
+    """installs the dynamic requires of the backend, if not done before"""
+    import json
+
+    stamp = os.path.join(
+        os.path.dirname(os.path.dirname(python)), "xvenv-buildenv.json"
+    )
+    with open(stamp) as f:
+        meta = json.load(f)
+    installed = set(meta.get("dynamic", []))
+    missing = sorted(set(requires) - installed)
+    if len(missing) == 0:
+        return
+    vprint("buildenv requires", *missing)
+    rc = buildenv_install(args_, python, missing)
+    if rc:
+        return rc
+    meta["dynamic"] = sorted(installed | set(missing))
+    with open(stamp, "w") as f:
+        json.dump(meta, f, indent=4)
+
+
+def copy_source_tree(dest):
+    import shutil
+
+    for fnam in source_files():
+        if not os.path.isfile(fnam):
+            continue
+        os.makedirs(os.path.join(dest, os.path.dirname(fnam)), exist_ok=True)
+        shutil.copy2(fnam, os.path.join(dest, fnam))
+
+
+def unpack_sdist(sdist, dest):
+    """unpacks the sdist, and returns the source folder"""
+    import tarfile
+
+    with tarfile.open(sdist) as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(dest, filter="data")
+        else:
+            tar.extractall(dest)
+    top = os.listdir(dest)[0]
+    # setuputil takes the project name from the folder name
+    src = os.path.join(dest, os.path.basename(os.getcwd()))
+    os.rename(os.path.join(dest, top), src)
+    return src
+
+
+def wheel_names(fnam):
+    import zipfile
+
+    with zipfile.ZipFile(fnam) as z:
+        return set(filter(lambda x: not x.endswith(".dist-info/RECORD"), z.namelist()))
+
+
+@trprint
+def pep517_build(args_):
+    """builds sdist and wheel in parallel with the hooks of the build backend.
+    the wheel is built from a copy of the source tree"""
+    import tempfile
+    import shutil
+
+    cfg = build_system()
+    python = buildenv(args_, cfg)
+    if python is None:
+        return 1
+
+    dist = os.path.abspath("dist")
+    os.makedirs(dist, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix="xvenv-pep517-")
+    try:
+        src = os.path.join(tmp, "tree", os.path.basename(os.getcwd()))
+        copy_source_tree(src)
+
+        rc = pep517_hooks(
+            python,
+            cfg,
+            [
+                ("sdist", ".", "get_requires_for_build_sdist", [{}]),
+                ("wheel", src, "get_requires_for_build_wheel", [{}]),
+            ],
+            tmp,
+        )
+        if rc is None:
+            return 1
+        if buildenv_requires(args_, python, rc[0] + rc[1]):
+            return 1
+
+        rc = pep517_hooks(
+            python,
+            cfg,
+            [
+                ("sdist", ".", "build_sdist", [dist, {}]),
+                ("wheel", src, "build_wheel", [dist, {}, None]),
+            ],
+            tmp,
+        )
+        if rc is None:
+            return 1
+        sdist, wheel = rc
+        print("built", sdist, wheel)
+
+        if getattr(args_, "verify", False):
+            return pep517_verify(args_, python, cfg, sdist, wheel, tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+@trprint
+def pep517_verify(args_, python, cfg, sdist, wheel, tmp):
+    """builds a wheel from the sdist, and compares it with the wheel
+    built from the source tree"""
+    src = unpack_sdist(os.path.join("dist", sdist), os.path.join(tmp, "verify"))
+    out = os.path.join(tmp, "verify-dist")
+    os.makedirs(out)
+    rc = pep517_hooks(
+        python, cfg, [("verify", src, "build_wheel", [out, {}, None])], tmp
+    )
+    if rc is None:
+        eprint("verify failed, wheel from sdist not built")
+        return 1
+
+    from_tree = wheel_names(os.path.join("dist", wheel))
+    from_sdist = wheel_names(os.path.join(out, rc[0]))
+    for fnam in sorted(from_tree - from_sdist):
+        eprint("verify", "missing in wheel from sdist", fnam)
+    for fnam in sorted(from_sdist - from_tree):
+        eprint("verify", "missing in wheel from tree", fnam)
+    if from_tree != from_sdist:
+        return 1
+    print("verify", "wheel from sdist ok")
+
+
+#
+# qtest check cache
+#
+# content hashes of the files with a clean black or flake8 result,
+# stored in .venv/.xvenv/qtest-cache.json. a file is checked again
+# after a change of the content, the tool version, or the tool cfg.
+#
+
+CHECK_CFGS = {
+    "black": ["black.cfg", "pyproject.toml"],
+    "flake8": ["flake8.cfg", "setup.cfg", "tox.ini", ".flake8"],
+}
+CHECK_PACKAGES = {
+    "black": ["black"],
+    "flake8": ["flake8", "pyflakes", "pycodestyle", "mccabe"],
+}
+
+
+# black applies its exclude only to scanned folders, not to files
+# given on the cmd-line. the default if not set in the black cfg
+BLACK_EXCLUDE = r"/(\.direnv|\.eggs|\.git|\.hg|\.ipynb_checkpoints|\.mypy_cache|\.nox|\.pytest_cache|\.ruff_cache|\.tox|\.svn|\.venv|\.vscode|__pypackages__|_build|buck-out|build|dist|venv)/"
+
+
+def black_cfg():
+    """the settings of black.cfg, or of pyproject.toml"""
+    fnam = "black.cfg" if os.path.exists("black.cfg") else "pyproject.toml"
+    if not os.path.exists(fnam):
+        return {}
+    try:
+        import tomllib
+    except ImportError:
+        vprint("reading", fnam, "requires python 3.11, black excludes not used")
+        return {}
+    try:
+        with open(fnam, "rb") as f:
+            cfg = tomllib.load(f).get("tool", {}).get("black", {})
+    except (OSError, ValueError) as ex:
+        eprint("reading", fnam, "failed", ex)
+        return {}
+    return {k.replace("_", "-"): v for k, v in cfg.items()}
+
+
+def black_force_exclude(exclude=None):
+    """regex for black --force-exclude, joining exclude, extend-exclude,
+    and force-exclude of the black cfg, and the qtest --exclude regex"""
+    cfg = black_cfg()
+    parts = [
+        cfg.get("exclude", BLACK_EXCLUDE),
+        cfg.get("extend-exclude"),
+        cfg.get("force-exclude"),
+        exclude,
+    ]
+    # black compiles regex with newlines as verbose
+    return "|".join(
+        f"(?x:{p})" if "\n" in p else f"(?:{p})" for p in filter(None, parts)
+    )
+
+
+class CheckCache(object):
+    """files with a clean result of black or flake8, keyed by content hash.
+    opts are part of the key"""
+
+    def __init__(self, tool, opts="", recheck=False):
+        self.fnam = os.path.join(xvenv_dir(), "qtest-cache.json")
+        self.tool = tool
+        self.opts = opts
+        self.cfg = getcfg(f"{tool}.cfg")
+        self.stamp = self.tool_stamp()
+        self.files = {}
+        self.todo = []
+        self.shards = []
+        self.temp = None
+        if not recheck:
+            self.load()
+
+    def tool_stamp(self):
+        inputs = [self.tool, self.cfg, self.opts]
+        inputs.extend(installed_version(p) for p in CHECK_PACKAGES[self.tool])
+        for fnam in CHECK_CFGS[self.tool]:
+            if os.path.exists(fnam):
+                inputs.append([fnam, file_digest(fnam).hexdigest()])
+        return StepManifest.fingerprint(*inputs)
+
+    def read(self):
+        import json
+
+        try:
+            with open(self.fnam) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self):
+        entry = self.read().get(self.tool, {})
+        if entry.get("stamp") == self.stamp:
+            self.files = entry.get("files", {})
+
+    def save(self):
+        import json
+
+        cont = self.read()
+        cont[self.tool] = {"stamp": self.stamp, "files": self.files}
+        os.makedirs(os.path.dirname(self.fnam), exist_ok=True)
+        with open(self.fnam, "w") as f:
+            json.dump(cont, f)
+
+    @staticmethod
+    def digest(fnam):
+        try:
+            return file_digest(fnam).hexdigest()
+        except OSError:
+            return None
+
+    def changed(self, files):
+        """files without a clean result for the current content"""
+        # removed files are dropped
+        self.files = {f: self.files[f] for f in files if f in self.files}
+        self.todo = [f for f in files if self.files.get(f) != self.digest(f)]
+        vprint(self.tool, len(self.todo), "of", len(files), "files changed")
+        return self.todo
+
+    def cmds(self, stage, jobs, verbose_=""):
+        """cmd-lines for the changed files, sharded when running with more than 1 job"""
+        import shlex
+        import tempfile
+
+        self.temp = tempfile.mkdtemp(prefix="xvenv-")
+        buckets = [f for f in shards(self.todo, max(1, jobs)) if len(f) > 0]
+        cmds = []
+        for i, files in enumerate(buckets):
+            out = os.path.join(self.temp, f"{stage}.{i}.txt")
+            report = ""
+            if self.tool == "flake8":
+                # the report tells the failed files
+                report = f"--output-file {shlex.quote(out)} --tee"
+            prefix = stage if len(buckets) == 1 else f"{stage}.{i}"
+            opts = f"{self.opts} {verbose_} {report}"
+            cmd = f"{self.tool} {self.cfg} {opts} {shlex.join(files)}"
+            cmds.append((prefix, cmd))
+            self.shards.append((files, out))
+        return cmds
+
+    def failed(self, out):
+        failed = set()
+        try:
+            with open(out) as f:
+                for line in f:
+                    failed.add(os.path.normpath(line.split(":")[0]))
+        except OSError:
+            pass
+        return failed
+
+    def done(self, rcs):
+        """records the clean files, returns the first failed rc"""
+        import shutil
+
+        rc = None
+        for (files, out), rc_ in zip(self.shards, rcs):
+            rc = rc or rc_
+            failed = self.failed(out)
+            if rc_ and len(failed) == 0:
+                # crashed, or black failed
+                continue
+            for f in files:
+                if f not in failed:
+                    # black might have changed the content
+                    self.files[f] = self.digest(f)
+        self.save()
+        if self.temp is not None:
+            shutil.rmtree(self.temp, ignore_errors=True)
+        self.shards = []
+        return rc
+
+
+#
+# qtest watch
+#
+# the project tree is watched with inotify, or by polling the mtimes.
+# after a change only the affected stages run, for the changed files.
+# the tools are forked from the warm forkserver with preloaded modules.
+#
+
+WATCH_SKIP = [
+    VENV,
+    ".git",
+    ".xvenv",
+    TRASH,
+    "__pycache__",
+    "build",
+    "dist",
+    "*.egg-info",
+]
+WATCH_CFGS = {
+    "black.cfg": ["format"],
+    "flake8.cfg": ["lint"],
+    "setup.cfg": ["lint", "test"],
+    "pyproject.toml": ["format", "lint", "test"],
+}
+WATCH_PRELOAD = ["black", "flake8.main.application", "unittest"]
+
+
+def watch_skip(name, exclude=None):
+    import fnmatch
+
+    skip = WATCH_SKIP + (exclude.split(",") if exclude else [])
+    return any(fnmatch.fnmatch(name, p) for p in skip)
+
+
+def watched(path):
+    return path.endswith(".py") or os.path.basename(path) in WATCH_CFGS
+
+
+class PollWatcher(object):
+    """compares the mtimes of the watched files"""
+
+    def __init__(self, root, exclude=None, interval=0.5):
+        self.root = root
+        self.exclude = exclude
+        self.interval = interval
+        self.files = self.scan()
+
+    def scan(self):
+        files = {}
+        for base, dirs, fnams in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not watch_skip(d, self.exclude)]
+            for f in fnams:
+                path = os.path.normpath(os.path.join(base, f))
+                if not watched(path):
+                    continue
+                try:
+                    files[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+        return files
+
+    def read(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        files = self.scan()
+        changed = set(
+            p for p in set(files) | set(self.files) if files.get(p) != self.files.get(p)
+        )
+        self.files = files
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """inotify with ctypes, one watch for each folder"""
+
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, root, exclude=None):
+        import ctypes
+        import ctypes.util
+
+        self.root = root
+        self.exclude = exclude
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wds = {}
+        try:
+            self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add(self, path):
+        import ctypes
+
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            # e.g. ENOSPC, max_user_watches exceeded
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", path)
+        self.wds[wd] = path
+
+    def add_tree(self, top):
+        for base, dirs, fnams in os.walk(top):
+            dirs[:] = [d for d in dirs if not watch_skip(d, self.exclude)]
+            self.add(base)
+
+    def read(self, timeout):
+        import select
+        import struct
+
+        changed = set()
+        if len(select.select([self.fd], [], [], timeout)[0]) == 0:
+            return changed
+        try:
+            buf = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos < len(buf):
+            wd, mask, cookie, size = struct.unpack_from("iIII", buf, pos)
+            name = buf[pos + 16 : pos + 16 + size].rstrip(b"\0")
+            pos += 16 + size
+            if wd not in self.wds or len(name) == 0:
+                continue
+            path = os.path.normpath(os.path.join(self.wds[wd], os.fsdecode(name)))
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and not watch_skip(
+                    os.path.basename(path), self.exclude
+                ):
+                    self.add_tree(path)
+                continue
+            if watched(path):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watcher(root, exclude=None, poll=False):
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root, exclude)
+        except (OSError, AttributeError) as ex:
+            vprint("inotify not available, polling", ex)
+    return PollWatcher(root, exclude)
+
+
+def watch_changes(w, debounce):
+    """blocks until files changed, and returns them after no further
+    change within debounce seconds"""
+    changed = set()
+    while len(changed) == 0:
+        changed = w.read(1)
+    while True:
+        more = w.read(debounce)
+        if len(more) == 0:
+            return changed
+        changed |= more
+
+
+def mtimes(files):
+    rc = {}
+    for f in files:
+        try:
+            rc[f] = os.stat(f).st_mtime_ns
+        except OSError:
+            pass
+    return rc
+
+
+def affected_tests(changed, root="."):
+    """test modules for the changed files. a changed test module itself,
+    or the test modules mentioning the name of a changed module.
+    None for all tests"""
+    import re
+
+    mods = test_modules(root)
+    files = {m: os.path.join(root, *m.split(".")) + ".py" for m in mods}
+    selected = set()
+    for path in changed:
+        rel = os.path.relpath(path, root)
+        if not os.path.exists(path):
+            # removed, might be imported anywhere
+            return
+        mod = os.path.splitext(rel)[0].replace(os.sep, ".")
+        if mod in files:
+            selected.add(mod)
+            continue
+        name = mod.split(".")[-1]
+        if name == "__init__":
+            return
+        regex = re.compile(rf"\b{re.escape(name)}\b")
+        users = []
+        for m, fnam in files.items():
+            try:
+                with open(fnam) as f:
+                    if regex.search(f.read()):
+                        users.append(m)
+            except OSError:
+                pass
+        if len(users) == 0:
+            return
+        selected.update(users)
+    return sorted(selected)
+
+
+def qtest_watch_cmds(args_, changed):
+    """python cmd-lines of the stages affected by the changed files.
+    changed None runs all stages for all files"""
+    stages = set()
+    full = set()
+    py_files = []
+    tests = None
+    if changed is None:
+        full.update(["format", "lint", "test"])
+    else:
+        py_files = sorted(p for p in changed if p.endswith(".py") and os.path.exists(p))
+        if len(py_files) > 0:
+            stages.update(["format", "lint"])
+        if any(p.endswith(".py") for p in changed):
+            stages.add("test")
+            tests = affected_tests(changed)
+        for path in changed:
+            # a changed cfg runs the stage for all files
+            full.update(WATCH_CFGS.get(os.path.basename(path), []))
+    stages.update(full)
+
+    cmds = []
+    if args_.format and "format" in stages:
+        cfg = getcfg("black.cfg").split()
+        if "format" in full:
+            files = ["."]
+            if args_.exclude:
+                files = ["--extend-exclude", args_.exclude, *files]
+        else:
+            files = ["--force-exclude", black_force_exclude(args_.exclude), *py_files]
+        cmds.append(("format", ["python", "-m", "black", *cfg, *files]))
+    if args_.lint and "lint" in stages:
+        cfg = getcfg("flake8.cfg").split()
+        exclude = args_.exclude or f"{VENV},{TRASH}"
+        if "lint" in full:
+            files = ["--exclude", exclude]
+        elif args_.exclude:
+            files = ["--extend-exclude", args_.exclude, *py_files]
+        else:
+            files = py_files
+        cmds.append(("lint", ["python", "-m", "flake8", *cfg, *files]))
+    if args_.unit_test and "test" in stages:
+        tests = [] if "test" in full else tests
+        cmds.append(("test", ["python", "-m", "unittest", *(tests or [])]))
+    return cmds
+
+
+@trprint
+def qtest_watch(args_):
+    """run the qtest stages after each change of the project files"""
+    root = "."
+    w = watcher(root, args_.exclude, args_.poll)
+    print("watching", os.path.abspath(root), "with", type(w).__name__)
+
+    changed = None
+    formatted = {}
+    try:
+        while True:
+            cmds = qtest_watch_cmds(args_, changed)
+            rc = None
+            for stage, cmd in cmds:
+                print(f"[{stage}]", *cmd[2:])
+                rc_ = forkserver_run(cmd, WATCH_PRELOAD, args_.idle)
+                if rc_ == 130:
+                    raise KeyboardInterrupt()
+                if rc_:
+                    eprint(stage, "failed with", rc_)
+                    rc = rc or rc_
+                if stage == "format":
+                    formatted = mtimes(python_files(exclude=args_.exclude))
+            print("qtest", "failed" if rc else "ok", time.strftime("%H:%M:%S"))
+
+            while True:
+                changed = watch_changes(w, args_.debounce)
+                # skip the files changed by the formatter
+                changed = set(
+                    p
+                    for p in changed
+                    if p not in formatted or mtimes([p]).get(p) != formatted[p]
+                )
+                formatted = {}
+                if len(changed) > 0:
+                    break
+            vprint("changed", *sorted(changed))
+    except KeyboardInterrupt:
+        print("watch stopped")
+    finally:
+        w.close()
+
+
 def getcfg(fnam):
     if os.path.exists(fnam):
         return f"--config {fnam}"
     return ""
 
 
-@trprint
-def qtest(args_):
-    no_rest_or_die(args_)
+def python_files(root=".", exclude=None):
+    """all python files below root, without venv and exclude folders"""
+    import fnmatch
+
+    skip = [VENV, ".git", ".xvenv", TRASH, "__pycache__", "build", "dist", "*.egg-info"]
+    if exclude:
+        skip.extend(exclude.split(","))
+    files = []
+    for base, dirs, fnams in os.walk(root):
+        dirs[:] = sorted(
+            filter(lambda x: not any(fnmatch.fnmatch(x, p) for p in skip), dirs)
+        )
+        for f in sorted(fnams):
+            if f.endswith(".py"):
+                files.append(os.path.normpath(os.path.join(base, f)))
+    return files
+
+
+def test_modules(root="."):
+    """test modules as found by unittest discovery"""
+    mods = []
+    for base, dirs, fnams in os.walk(root):
+        if base != root and not os.path.exists(os.path.join(base, "__init__.py")):
+            dirs[:] = []
+            continue
+        dirs[:] = sorted(filter(lambda x: x not in [VENV, ".git"], dirs))
+        for f in sorted(fnams):
+            if f.startswith("test") and f.endswith(".py"):
+                rel = os.path.relpath(os.path.join(base, f[:-3]), root)
+                mods.append(rel.replace(os.sep, "."))
+    return mods
+
+
+def shards(files, n):
+    """split files in n shards of about the same size"""
+    buckets = [[0, []] for i in range(n)]
+    sized = []
+    for f in files:
+        try:
+            sized.append((os.path.getsize(f), f))
+        except OSError:
+            pass
+    for size, f in sorted(sized, reverse=True):
+        bucket = min(buckets, key=lambda x: x[0])
+        bucket[0] += size
+        bucket[1].append(f)
+    return [sorted(b[1]) for b in buckets if len(b[1]) > 0]
+
+
+def shards_by_count(items, n):
+    return [items[i::n] for i in range(min(n, len(items)))]
+
+
+def run_parallel(cmds, jobs):
+    """runs (prefix, cmd) within the venv in parallel. returns list of rc"""
+    import asyncio
+
+    rcs = [None] * len(cmds)
+    specs = []
+    for i, (prefix, cmd) in enumerate(cmds):
+        spec = venv_spec(cmd)
+        if type(spec) == int:
+            rcs[i] = spec
+            continue
+        spec.update({"prefix": prefix, "timeout": timeout_})
+        specs.append((i, spec))
+
+    temps = [spec.pop("temp", None) for i, spec in specs]
+    try:
+        results = asyncio.run(run_many([spec for i, spec in specs], jobs))
+    finally:
+        for temp in filter(lambda x: x is not None, temps):
+            remove_temp(temp)
+
+    for (i, spec), res in zip(specs, results):
+        rcs[i] = res.rc
+    return rcs
+
+
+def qtest_check(args_, stage, jobs):
+    """check cache of the format or lint stage, and the cmd-lines
+    for the files changed since the last clean run"""
+    import shlex
+
+    files = python_files(exclude=args_.exclude)
+    if stage == "format":
+        opts = f"--force-exclude {shlex.quote(black_force_exclude(args_.exclude))}"
+        check = CheckCache("black", opts, args_.recheck)
+        # skip the files ignored by git, like black scanning a folder
+        tracked = set(source_files())
+        files = [f for f in files if f in tracked]
+    else:
+        opts = ""
+        if args_.exclude:
+            opts = f"--extend-exclude {shlex.quote(args_.exclude)}"
+        check = CheckCache("flake8", opts, args_.recheck)
+    dprint(check.tool, "cfg", check.cfg, opts)
+    check.changed(files)
+    return check, check.cmds(stage, jobs, "-v" if debug else "")
+
 
+def qtest_cmds(args_, stage, jobs):
+    """cmd-lines for a qtest stage, sharded when running with more than 1 job"""
     verbose_ = "-v" if debug else ""
-    exclude_ = "--exclude " + args.exclude if args.exclude else ""
 
-    with VerboseOn():
+    if stage == "test":
+        mods = test_modules() if jobs > 1 else []
+        if len(mods) > 1:
+            return [
+                (f"test.{i}", f"{args_.python} -m unittest {verbose_} {' '.join(m)}")
+                for i, m in enumerate(shards_by_count(mods, jobs))
+            ]
+        return [("test", f"{args_.python} -m unittest {verbose_}")]
+
 
-        if args_.format:
-            vprint("formating...")
-            BLACK_CFG = "black.cfg"
-            cfg = getcfg(BLACK_CFG)
-            dprint("black cfg", cfg)
-            rc = extrun(f"black {cfg} {verbose_} {exclude_} .")
-            or_die_with_mesg(rc, "black failed")
-
-        if args_.lint:
-            vprint("linting...")
-            FLAKE8_CFG = "flake8.cfg"
-            cfg = getcfg(FLAKE8_CFG)
-            dprint("lint cfg", cfg)
-            exclude_ = "--exclude '.venv'" if exclude_ == "" else exclude_
-            dprint("exclude", exclude_)
-            rc = extrun(f"flake8 {cfg} {verbose_} {exclude_}")
-
-        if args_.unit_test:
-            vprint("testing...")
-            rc = extrun(f"{args_.python} -m unittest {verbose_}")
+@trprint
+def qtest(args_):
+    no_rest_or_die(args_)
 
     if not any([args_.format, args_.lint, args_.unit_test]):
         eprint("what? use --help")
+        return
 
+    if args_.watch:
+        return qtest_watch(args_)
 
-def main_func():
+    jobs = args_.jobs if args_.jobs > 0 else os.cpu_count()
+    with VerboseOn():
+        if jobs <= 1:
+            return qtest_serial(args_)
+        return qtest_parallel(args_, jobs)
+
+
+def qtest_serial(args_):
+    rc = None
+    if args_.format:
+        vprint("formating...")
+        with ProjectLock():
+            check, cmds = qtest_check(args_, "format", 1)
+            rc = check.done([venvrun(cmd) for prefix, cmd in cmds])
+        or_die_with_mesg(rc, "black failed")
+    if args_.lint:
+        vprint("linting...")
+        check, cmds = qtest_check(args_, "lint", 1)
+        rc = check.done([venvrun(cmd) for prefix, cmd in cmds]) or rc
+    if args_.unit_test:
+        vprint("testing...")
+        rc = venvrun(qtest_cmds(args_, "test", 1)[0][1]) or rc
+    return rc
+
+
+def qtest_parallel(args_, jobs):
+    rc = None
+    # formating modifies the files, and runs before lint and test
+    if args_.format:
+        vprint("formating...", "jobs", jobs)
+        with ProjectLock():
+            check, cmds = qtest_check(args_, "format", jobs)
+            rc = check.done(run_parallel(cmds, jobs))
+        or_die_with_mesg(rc, "black failed")
+
+    cmds = []
+    check = None
+    if args_.lint:
+        check, cmds = qtest_check(args_, "lint", jobs)
+    lint_cmds = len(cmds)
+    if args_.unit_test:
+        cmds.extend(qtest_cmds(args_, "test", jobs))
+    if len(cmds) > 0:
+        vprint("linting and testing...", "jobs", jobs)
+        rcs = run_parallel(cmds, jobs)
+        if check is not None:
+            check.done(rcs[:lint_cmds])
+        for (prefix, cmd), rc_ in zip(cmds, rcs):
+            if rc_:
+                eprint(prefix, "failed with", rc_)
+                rc = rc or rc_
+
+    return rc
 
-    global args, debug, verbose, python_, tools_, keep_temp, cwd, ewd, cdvenv, shell_, shell_opts_
 
+def main_parser():
+    """parser with the global opts, without sub-cmds"""
     parser = argparse.ArgumentParser(
         prog="xvenv",
         usage=f"{python_} -m %(prog)s [options]",
@@ -513,6 +3978,13 @@ def main_func():
         default=False,
     )
 
+    parser.add_argument(
+        "-venv-name",
+        dest="venv_name",
+        help="venv folder name, instead of '.venv' (default: %(default)s)",
+        default=None,
+    )
+
     parser.add_argument(
         "-sh",
         dest="shell",
@@ -526,6 +3998,32 @@ def main_func():
         default=shell_opts_,
     )
 
+    parser.add_argument(
+        "-use-shell",
+        "-ush",
+        dest="use_shell",
+        action="store_true",
+        help="run with login shell and bin/activate instead of direct execution (default: %(default)s)",
+        default=use_shell,
+    )
+
+    parser.add_argument(
+        "-timeout",
+        dest="timeout",
+        type=float,
+        help="timeout in seconds for each step process (default: %(default)s)",
+        default=timeout_,
+    )
+
+    parser.add_argument(
+        "--profile",
+        "-prof",
+        dest="profile",
+        metavar="FILE",
+        help="write a timeline of all steps and processes in chrome trace-event json format (default: %(default)s)",
+        default=None,
+    )
+
     parser.add_argument(
         "-python",
         "-p",
@@ -557,10 +4055,40 @@ def main_func():
         default=keep_temp,
     )
 
-    subparsers = parser.add_subparsers(help="sub-command --help")
+    parser.add_argument(
+        "-cache-dir",
+        dest="cache_dir",
+        help="cache folder, or env XVENV_CACHE (default: %(default)s)",
+        default=cache_dir_,
+    )
+    parser.add_argument(
+        "-cache-size",
+        dest="cache_size",
+        type=int,
+        help="max cache size in MB (default: %(default)s)",
+        default=cache_size_,
+    )
+    parser.add_argument(
+        "-log-tail",
+        dest="log_tail",
+        type=int,
+        help="output lines of a failed step printed from its log (default: %(default)s)",
+        default=log_tail_,
+    )
 
+    return parser
+
+
+def add_setup_parser(subparsers):
     setup_parser = subparsers.add_parser("setup", help="setup a venv in folder '.venv'")
     setup_parser.set_defaults(func=setup)
+    setup_parser.add_argument(
+        "--wait",
+        "-w",
+        action="store_true",
+        default=False,
+        help="wait until removed folders are deleted, instead of deleting in background (default: %(default)s)",
+    )
 
     setup_parser.add_argument(
         "--clear",
@@ -574,16 +4102,43 @@ def main_func():
         "-cp",
         action="store_true",
         default=False,
-        help="use copy instead of symlink (default: %(default)s)",
+        help="copy the interpreter instead of symlink, with reflinks if supported (default: %(default)s)",
+    )
+    setup_parser.add_argument(
+        "--cache",
+        "-C",
+        action="store_true",
+        default=False,
+        help="use venv from cache if present (default: %(default)s)",
     )
 
+
+def add_pip_parser(subparsers):
     pip_parser = subparsers.add_parser("pip", help="install pip")
     pip_parser.set_defaults(func=pip)
+    pip_parser.add_argument(
+        "--wheelhouse",
+        "-wh",
+        nargs="?",
+        const="",
+        default=None,
+        help="install from wheelhouse folder without index access. without folder uses the wheelhouse in the cache folder (default: %(default)s)",
+    )
 
+
+def add_req_parser(subparsers):
     req_parser = subparsers.add_parser(
         "req", help="install requirements.txt if present"
     )
     req_parser.set_defaults(func=req)
+    req_parser.add_argument(
+        "--wheelhouse",
+        "-wh",
+        nargs="?",
+        const="",
+        default=None,
+        help="install from wheelhouse folder without index access. without folder uses the wheelhouse in the cache folder (default: %(default)s)",
+    )
     req_parser.add_argument(
         "--no-req-update",
         "-norequp",
@@ -600,9 +4155,38 @@ def main_func():
         default=False,
         help="update requirements (default: %(default)s)",
     )
+    req_parser.add_argument(
+        "--lock",
+        "-lck",
+        action="store_true",
+        default=False,
+        help="install the resolved and hashed set of requirements without dependency resolution. creates the lock if not present (default: %(default)s)",
+    )
+    req_parser.add_argument(
+        "--relock",
+        action="store_true",
+        default=False,
+        help="resolve requirements again, and replace the lock (default: %(default)s)",
+    )
+    req_parser.add_argument(
+        "-constraint",
+        type=str,
+        default=None,
+        help="constraints file for the lock, or constraints.txt if present (default: %(default)s)",
+    )
 
+
+def add_tools_parser(subparsers):
     tools_parser = subparsers.add_parser("tools", help="install tools")
     tools_parser.set_defaults(func=tools)
+    tools_parser.add_argument(
+        "--wheelhouse",
+        "-wh",
+        nargs="?",
+        const="",
+        default=None,
+        help="install from wheelhouse folder without index access. without folder uses the wheelhouse in the cache folder (default: %(default)s)",
+    )
     tools_parser.add_argument(
         "--update-deps",
         "-u",
@@ -625,17 +4209,210 @@ def main_func():
         help="tool to install (default: %(default)s)",
     )
 
+
+def add_deps_parser(subparsers):
+    deps_parser = subparsers.add_parser(
+        "deps", help="install tools and requirements.txt with a single pip run"
+    )
+    deps_parser.set_defaults(func=deps)
+    deps_parser.add_argument(
+        "--wheelhouse",
+        "-wh",
+        nargs="?",
+        const="",
+        default=None,
+        help="install from wheelhouse folder without index access. without folder uses the wheelhouse in the cache folder (default: %(default)s)",
+    )
+    deps_parser.add_argument(
+        "--update-deps",
+        "-u",
+        action="store_true",
+        default=False,
+        help="update deps (default: %(default)s)",
+    )
+    deps_parser.add_argument(
+        "--no-req-update",
+        "-norequp",
+        "-nru",
+        action="store_true",
+        default=False,
+        help="do not install requirements (default: %(default)s)",
+    )
+    deps_parser.add_argument(
+        "--update-req",
+        "-ureq",
+        "-ur",
+        action="store_true",
+        default=False,
+        help="update requirements (default: %(default)s)",
+    )
+    deps_parser.add_argument(
+        "-tool",
+        nargs="*",
+        action="store",
+        default=tools_,
+        help="tool to install (default: %(default)s)",
+    )
+    deps_parser.add_argument(
+        "-constraint",
+        default=None,
+        help="pip constraints file, uses constraints.txt if present (default: %(default)s)",
+    )
+
+
+def add_wheelhouse_parser(subparsers):
+    wheelhouse_parser = subparsers.add_parser(
+        "wheelhouse",
+        help="download wheels for requirements.txt and tools, and build sdists",
+    )
+    wheelhouse_parser.set_defaults(func=wheelhouse)
+    wheelhouse_parser.add_argument(
+        "-dir",
+        default=None,
+        help="wheelhouse folder, or wheelhouse in the cache folder (default: %(default)s)",
+    )
+    wheelhouse_parser.add_argument(
+        "-tool",
+        nargs="*",
+        action="store",
+        default=tools_,
+        help="tool to download (default: %(default)s)",
+    )
+    wheelhouse_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=0,
+        help="parallel sdist builds. 0 for all cores (default: %(default)s)",
+    )
+
+
+def add_matrix_parser(subparsers):
+    matrix_parser = subparsers.add_parser(
+        "matrix",
+        help="run make, or another sub-cmd, for several interpreters in parallel. each in its own venv",
+    )
+    matrix_parser.set_defaults(func=matrix)
+    matrix_parser.add_argument(
+        "-python",
+        "-p",
+        dest="interpreters",
+        nargs="+",
+        required=True,
+        help="python interpreter executables",
+    )
+    matrix_parser.add_argument(
+        "-step",
+        default="make",
+        help="sub-cmd to run, all other opts are passed to the sub-cmd (default: %(default)s)",
+    )
+    matrix_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=0,
+        help="max parallel interpreters. 0 for all cores (default: %(default)s)",
+    )
+
+
+def add_workspace_parser(subparsers):
+    workspace_parser = subparsers.add_parser(
+        "workspace",
+        help="run make, qtest, or run for all projects below a folder in parallel. all opts after the sub-cmd are passed to it",
+        allow_abbrev=False,
+    )
+    workspace_parser.set_defaults(func=workspace)
+    workspace_parser.add_argument(
+        "step",
+        choices=["make", "qtest", "run"],
+        help="sub-cmd to run in each project",
+    )
+    workspace_parser.add_argument(
+        "-dir",
+        type=str,
+        default=".",
+        help="workspace folder, projects are sub folders with setup.py or requirements.txt (default: %(default)s)",
+    )
+    workspace_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=0,
+        help="projects in parallel, 0 for all cores (default: %(default)s)",
+    )
+    workspace_parser.add_argument(
+        "--wheelhouse",
+        "-wh",
+        nargs="?",
+        const="",
+        default=None,
+        help="add the wheelhouse folder to the pip find-links of all projects, with index access. without folder uses the wheelhouse in the cache folder (default: %(default)s)",
+    )
+    workspace_parser.add_argument(
+        "-tail",
+        type=int,
+        default=20,
+        help="output lines printed for failed projects (default: %(default)s)",
+    )
+
+
+def add_clean_parser(subparsers):
     clean_parser = subparsers.add_parser(
         "clean",
-        help="clean all build related folders",
+        help="clean build related folders, and python caches",
     )
     clean_parser.set_defaults(func=clean)
+    clean_parser.add_argument(
+        "-pattern",
+        "-pat",
+        type=str,
+        nargs="+",
+        default=None,
+        help="file or folder name patterns to remove, a leading '/' matches only in the current folder. "
+        + f"(default: {' '.join(CLEAN_PATTERNS)})",
+    )
+    clean_parser.add_argument(
+        "--wait",
+        "-w",
+        action="store_true",
+        default=False,
+        help="wait until removed folders are deleted, instead of deleting in background (default: %(default)s)",
+    )
 
+
+def add_build_parser(subparsers):
     build_parser = subparsers.add_parser(
         "build",
         help="build with setuptools. like calling setup sdist build bdist_wheel",
     )
     build_parser.set_defaults(func=build)
+    build_parser.add_argument(
+        "--wait",
+        "-w",
+        action="store_true",
+        default=False,
+        help="wait until removed folders are deleted, instead of deleting in background (default: %(default)s)",
+    )
+    build_parser.add_argument(
+        "--cache",
+        "-C",
+        action="store_true",
+        default=False,
+        help="restore the artifacts in dist from the build cache, if the sources are unchanged (default: %(default)s)",
+    )
+    build_parser.add_argument(
+        "--pep517",
+        "-pep",
+        action="store_true",
+        default=False,
+        help="build sdist and wheel in parallel with the build backend hooks, within a reused build venv (default: %(default)s)",
+    )
+    build_parser.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="with --pep517, build a wheel from the sdist and compare with the wheel from the source tree (default: %(default)s)",
+    )
     build_parser.add_argument(
         "--build-clean",
         "-bclr",
@@ -651,19 +4428,88 @@ def main_func():
         help="clean all build related folders, but don't start build (default: %(default)s)",
     )
 
+
+def add_install_parser(subparsers):
     install_parser = subparsers.add_parser(
         "install", help="pip install editabe in venv"
     )
     install_parser.set_defaults(func=install)
 
+
+def add_compile_parser(subparsers):
+    compile_parser = subparsers.add_parser(
+        "compile", help="compile site-packages and the project sources to pyc"
+    )
+    compile_parser.set_defaults(func=precompile)
+    compile_parser.add_argument(
+        "-opt",
+        type=int,
+        nargs="+",
+        choices=[0, 1, 2],
+        default=[0],
+        help="optimization levels to compile for (default: %(default)s)",
+    )
+    compile_parser.add_argument(
+        "--invalidation-mode",
+        "-inv",
+        choices=["timestamp", "checked-hash", "unchecked-hash"],
+        default=None,
+        help="pyc invalidation mode, checked-hash keeps the pyc files valid after copying (default: %(default)s)",
+    )
+    compile_parser.add_argument(
+        "--exclude",
+        "-ex",
+        type=str,
+        default=None,
+        help="exclude folders of the project, comma separated (default: %(default)s)",
+    )
+    compile_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=0,
+        help="parallel processes, 0 for all cores (default: %(default)s)",
+    )
+
+
+def add_pypi_parser(subparsers):
     pypi_parser = subparsers.add_parser(
         "pypi",
         help="pypi helper. just prints some helping information for using with pypi and twine",
     )
     pypi_parser.set_defaults(func=pypi)
 
+
+def add_binst_parser(subparsers):
     binst_parser = subparsers.add_parser("binst", help="build and install")
     binst_parser.set_defaults(func=binst)
+    binst_parser.add_argument(
+        "--wait",
+        "-w",
+        action="store_true",
+        default=False,
+        help="wait until removed folders are deleted, instead of deleting in background (default: %(default)s)",
+    )
+    binst_parser.add_argument(
+        "--cache",
+        "-C",
+        action="store_true",
+        default=False,
+        help="restore the artifacts in dist from the build cache, if the sources are unchanged (default: %(default)s)",
+    )
+    binst_parser.add_argument(
+        "--pep517",
+        "-pep",
+        action="store_true",
+        default=False,
+        help="build sdist and wheel in parallel with the build backend hooks, within a reused build venv (default: %(default)s)",
+    )
+    binst_parser.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="with --pep517, build a wheel from the sdist and compare with the wheel from the source tree (default: %(default)s)",
+    )
     binst_parser.add_argument(
         "--build-clean",
         "-bclr",
@@ -679,10 +4525,27 @@ def main_func():
         help="clean all build related folders, but don't start build (default: %(default)s)",
     )
 
+
+def add_make_parser(subparsers):
     make_parser = subparsers.add_parser(
         "make", help="sets up a venv and installs everything"
     )
     make_parser.set_defaults(func=make)
+    make_parser.add_argument(
+        "--wait",
+        "-w",
+        action="store_true",
+        default=False,
+        help="wait until removed folders are deleted, instead of deleting in background (default: %(default)s)",
+    )
+    make_parser.add_argument(
+        "--wheelhouse",
+        "-wh",
+        nargs="?",
+        const="",
+        default=None,
+        help="install from wheelhouse folder without index access. without folder uses the wheelhouse in the cache folder (default: %(default)s)",
+    )
 
     make_parser.add_argument(
         "--quick",
@@ -691,6 +4554,13 @@ def main_func():
         default=False,
         help="quick install without build and install steps (default: %(default)s)",
     )
+    make_parser.add_argument(
+        "--force",
+        "-F",
+        action="store_true",
+        default=False,
+        help="run all steps, even when the inputs are unchanged (default: %(default)s)",
+    )
     make_parser.add_argument(
         "--clear",
         "-c",
@@ -698,12 +4568,19 @@ def main_func():
         default=False,
         help="clear before setup (default: %(default)s)",
     )
+    make_parser.add_argument(
+        "--cache",
+        "-C",
+        action="store_true",
+        default=False,
+        help="use venv from cache if present, or store into cache. same for the build artifacts (default: %(default)s)",
+    )
     make_parser.add_argument(
         "--copy",
         "-cp",
         action="store_true",
         default=False,
-        help="use copy instead of symlink (default: %(default)s)",
+        help="copy the interpreter instead of symlink, with reflinks if supported (default: %(default)s)",
     )
     make_parser.add_argument(
         "--update-deps",
@@ -735,6 +4612,18 @@ def main_func():
         default=False,
         help="remove tool (default: %(default)s)",
     )
+    make_parser.add_argument(
+        "--separate",
+        "-sep",
+        action="store_true",
+        default=False,
+        help="install tools and requirements.txt in separate pip runs (default: %(default)s)",
+    )
+    make_parser.add_argument(
+        "-constraint",
+        default=None,
+        help="pip constraints file, uses constraints.txt if present (default: %(default)s)",
+    )
     make_parser.add_argument(
         "-tool",
         nargs="*",
@@ -756,24 +4645,170 @@ def main_func():
         default=False,
         help="clean all build related folders, but don't start build (default: %(default)s)",
     )
+    make_parser.add_argument(
+        "--compile",
+        "-co",
+        action="store_true",
+        default=False,
+        help="compile site-packages and the project sources to pyc as last step (default: %(default)s)",
+    )
+    make_parser.add_argument(
+        "-opt",
+        type=int,
+        nargs="+",
+        choices=[0, 1, 2],
+        default=[0],
+        help="optimization levels to compile for (default: %(default)s)",
+    )
+    make_parser.add_argument(
+        "--invalidation-mode",
+        "-inv",
+        choices=["timestamp", "checked-hash", "unchecked-hash"],
+        default=None,
+        help="pyc invalidation mode, checked-hash keeps the pyc files valid after copying (default: %(default)s)",
+    )
 
-    run_parser = subparsers.add_parser("run", help="run a command")
+
+def add_run_parser(subparsers):
+    run_parser = subparsers.add_parser(
+        "run",
+        help="run a command. the opts are given before the command",
+        allow_abbrev=False,
+    )
     run_parser.set_defaults(func=run)
+    run_parser.add_argument(
+        "--forkserver",
+        "-fs",
+        action="store_true",
+        default=False,
+        help="fork python cmd-lines from a warm interpreter within the venv (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--preload",
+        "-pre",
+        action="append",
+        default=None,
+        help="module to preload in the forkserver, can be given multiple times (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--idle",
+        type=int,
+        default=FORKSERVER_IDLE,
+        help="forkserver shutdown after idle seconds (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--from",
+        dest="tasks",
+        metavar="FILE",
+        default=None,
+        help="run each line of the file as cmd-line within the venv, '-' for stdin (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="with --from, tasks in parallel, 0 for all cores (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--keep-going",
+        action="store_true",
+        default=False,
+        help="with --from, run all tasks also if one fails, instead of stopping all (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--capture",
+        action="store_true",
+        default=False,
+        help="with --from, print the output of each task at the end, instead of prefixed lines (default: %(default)s)",
+    )
     # run_parser.add_argument("files", nargs="+", action="store", type=str)
 
+
+def add_test_parser(subparsers):
     test_parser = subparsers.add_parser(
         "test", help="test venv environment. outputs pip path and os.environ"
     )
     test_parser.set_defaults(func=test)
 
+
+def add_clone_parser(subparsers):
     clone_parser = subparsers.add_parser("clone", help="clone xvenv.py to cwd folder")
     clone_parser.set_defaults(func=clone)
 
+
+def add_clone_venv_parser(subparsers):
+    clone_venv_parser = subparsers.add_parser(
+        "clone-venv",
+        help="copy the venv to another folder, e.g. for parallel test runs",
+    )
+    clone_venv_parser.set_defaults(func=clone_venv)
+    clone_venv_parser.add_argument(
+        "dest",
+        help="destination folder",
+    )
+    clone_venv_parser.add_argument(
+        "--no-hardlink",
+        "-nhl",
+        action="store_true",
+        default=False,
+        help="copy read-only files in site-packages instead of hardlinks, if reflinks are not supported (default: %(default)s)",
+    )
+
+
+def add_logs_parser(subparsers):
+    logs_parser = subparsers.add_parser(
+        "logs", help="print the log of the last run of a step, or list the logs"
+    )
+    logs_parser.set_defaults(func=logs)
+    logs_parser.add_argument(
+        "step",
+        nargs="?",
+        default=None,
+        help="step or sub-cmd name, e.g. deps (default: %(default)s)",
+    )
+
+
+def add_drop_parser(subparsers):
     drop_parser = subparsers.add_parser(
         "drop", help="removes the '.venv' folder, and all contents"
     )
     drop_parser.set_defaults(func=drop)
+    drop_parser.add_argument(
+        "--wait",
+        "-w",
+        action="store_true",
+        default=False,
+        help="wait until removed folders are deleted, instead of deleting in background (default: %(default)s)",
+    )
+
+
+def add_cache_parser(subparsers):
+    cache_parser = subparsers.add_parser("cache", help="list or prune the venv cache")
+    cache_parser.set_defaults(func=cache)
+    cache_parser.add_argument(
+        "action",
+        nargs="?",
+        choices=["ls", "prune"],
+        default="ls",
+        help="list, or prune least recently used entries (default: %(default)s)",
+    )
+    cache_parser.add_argument(
+        "--all",
+        "-a",
+        action="store_true",
+        default=False,
+        help="prune all entries (default: %(default)s)",
+    )
+    cache_parser.add_argument(
+        "--max-size",
+        "-max",
+        type=int,
+        default=cache_size_,
+        help="prune until cache size in MB is below (default: %(default)s)",
+    )
 
+
+def add_qtest_parser(subparsers):
     qtest_parser = subparsers.add_parser("qtest", help="run quality helpers")
     qtest_parser.set_defaults(func=qtest)
 
@@ -808,11 +4843,138 @@ def main_func():
         default=False,
         help="run unittest",
     )
+    qtest_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="run lint and unittest in parallel, and shard the files in jobs processes. 0 for all cores (default: %(default)s)",
+    )
+    qtest_parser.add_argument(
+        "--recheck",
+        "-rc",
+        action="store_true",
+        default=False,
+        help="format and lint all files, not only the files changed since the last clean run (default: %(default)s)",
+    )
+    qtest_parser.add_argument(
+        "--watch",
+        "-wt",
+        action="store_true",
+        default=False,
+        help="watch the project files, and run the stages affected by a change. the tools are started from the forkserver (default: %(default)s)",
+    )
+    qtest_parser.add_argument(
+        "--poll",
+        action="store_true",
+        default=False,
+        help="with --watch, poll for changes instead of inotify (default: %(default)s)",
+    )
+    qtest_parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.2,
+        help="with --watch, seconds without further change before running (default: %(default)s)",
+    )
+    qtest_parser.add_argument(
+        "--idle",
+        type=int,
+        default=FORKSERVER_IDLE,
+        help="with --watch, forkserver shutdown after idle seconds (default: %(default)s)",
+    )
+
 
-    #
+SUBPARSERS = {
+    "setup": add_setup_parser,
+    "pip": add_pip_parser,
+    "req": add_req_parser,
+    "tools": add_tools_parser,
+    "deps": add_deps_parser,
+    "wheelhouse": add_wheelhouse_parser,
+    "matrix": add_matrix_parser,
+    "workspace": add_workspace_parser,
+    "clean": add_clean_parser,
+    "build": add_build_parser,
+    "install": add_install_parser,
+    "compile": add_compile_parser,
+    "pypi": add_pypi_parser,
+    "binst": add_binst_parser,
+    "make": add_make_parser,
+    "run": add_run_parser,
+    "test": add_test_parser,
+    "clone": add_clone_parser,
+    "clone-venv": add_clone_venv_parser,
+    "logs": add_logs_parser,
+    "drop": add_drop_parser,
+    "cache": add_cache_parser,
+    "qtest": add_qtest_parser,
+}
+
+
+def split_passthru(parser, argv, positionals=0):
+    """splits argv at the first arg after the opts, their values, and the
+    given number of positionals. the second part is not parsed by argparse"""
+    opts = parser._option_string_actions
+    skip = False
+    for i, arg in enumerate(argv):
+        if skip:
+            skip = False
+        elif arg == "--":
+            return argv[:i], argv[i + 1 :]
+        elif arg.startswith("-"):
+            action = opts.get(arg)
+            skip = action is not None and action.nargs != 0
+        elif positionals == 0:
+            return argv[:i], argv[i:]
+        else:
+            positionals -= 1
+    return argv, []
+
+
+def subcmd_name(parser, argv):
+    """the first positional arg, skipping the global opts and their values"""
+    head, rest = split_passthru(parser, argv)
+    return rest[0] if len(rest) > 0 else None
+
+
+# sub-cmds passing the cmd-line after the number of positionals to the next tool
+PASSTHRU = {
+    "run": 0,
+    "workspace": 1,
+}
+
+
+def main_func():
 
-    args, rest = parser.parse_known_args()
-    args.rest = rest
+    global args, debug, verbose, python_, tools_, keep_temp, cwd, ewd, cdvenv, shell_, shell_opts_
+    global cache_dir_, cache_size_, use_shell, timeout_, profiler, log_tail_
+
+    parser = main_parser()
+    subparsers = parser.add_subparsers(help="sub-command --help")
+
+    # build only the parser of the sub-cmd given.
+    # all for the help, or for listing the choices of an unknown sub-cmd
+    name = subcmd_name(parser, sys.argv[1:])
+    if name is None:
+        build_all = any(map(lambda x: x in ["-h", "--help"], sys.argv[1:]))
+    else:
+        build_all = name not in SUBPARSERS
+    for key, add_parser in SUBPARSERS.items():
+        if build_all or key == name:
+            add_parser(subparsers)
+
+    # the opts of the sub-cmd are parsed only before the passed cmd-line
+    argv = sys.argv[1:]
+    passthru = []
+    if name in PASSTHRU:
+        head, rest = split_passthru(parser, argv)
+        sub_head, passthru = split_passthru(
+            subparsers.choices[name], rest[1:], PASSTHRU[name]
+        )
+        argv = [*head, name, *sub_head]
+
+    args, rest = parser.parse_known_args(argv)
+    args.rest = rest + passthru
 
     debug = args.debug
     dprint("arguments", args)
@@ -821,19 +4983,39 @@ def main_func():
     if venv_no_dot:
         global VENV
         VENV = VENV.replace(".", "")
+    if args.venv_name:
+        VENV = args.venv_name
 
     shell_ = args.shell
     shell_opts_ = args.shell_opts
+    use_shell = args.use_shell
+    timeout_ = args.timeout
 
     keep_temp = args.keep_temp
-    cwd = args.cwd
+    # absolute, the sub-cmds change into it more than once
+    cwd = os.path.abspath(args.cwd)
     ewd = args.ewd
     cdvenv = args.cdvenv
+    cache_dir_ = args.cache_dir
+    cache_size_ = args.cache_size
+    log_tail_ = args.log_tail
 
     verbose = args.verbose
 
+    if args.profile:
+        profiler = Profiler(os.path.abspath(args.profile))
+
     if "func" in args:
-        rc = args.func(args)
+        if name not in SUBPARSERS:
+            name = args.func.__name__
+        try:
+            with StepLog(name) as log:
+                rc = args.func(args)
+                if rc:
+                    log.print_tail()
+        finally:
+            if profiler is not None:
+                profiler.write()
         dprint("result:", rc)
         return rc
     else: